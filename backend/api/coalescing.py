@@ -0,0 +1,136 @@
+import fcntl
+import hashlib
+import time
+import uuid
+from functools import partial, wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_KEY = 'single-flight:{}'
+# Файловые блокировки распределяются по фиксированному числу файлов,
+# чтобы каталог блокировок не рос с числом ключей.
+LOCK_STRIPES = 256
+
+
+class CacheLock:
+    """Блокировка через cache.add общего кэша (база данных, файлы)."""
+
+    def __init__(self, key):
+        self.key = LOCK_KEY.format(key)
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return cache.add(
+            self.key,
+            self.token,
+            settings.SINGLE_FLIGHT_LOCK_TIMEOUT
+        )
+
+    def release(self):
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+    def locked(self):
+        return cache.get(self.key) is not None
+
+
+class FileLock:
+    """Блокировка через flock файла, общая для процессов одного хоста."""
+
+    def __init__(self, key):
+        stripe = int(hashlib.md5(key.encode()).hexdigest(), 16)
+        self.path = Path(settings.SINGLE_FLIGHT_LOCK_DIR) / (
+            f'{stripe % LOCK_STRIPES}.lock'
+        )
+        self.file = None
+
+    def _try_lock(self, file, operation):
+        try:
+            fcntl.flock(file, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, 'a')
+        if not self._try_lock(file, fcntl.LOCK_EX):
+            file.close()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+    def locked(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as file:
+            return not self._try_lock(file, fcntl.LOCK_SH)
+
+
+LOCKS = {
+    'cache': CacheLock,
+    'file': FileLock,
+}
+
+
+def get_lock(key):
+    """Блокировка ключа выбранного в SINGLE_FLIGHT_LOCK вида."""
+    return LOCKS[settings.SINGLE_FLIGHT_LOCK](key)
+
+
+def coalesce(key, compute, load=None, stale=None):
+    """Пересчёт значения по ключу только в одном воркере.
+
+    Захвативший блокировку выполняет compute(). Остальные получают
+    устаревшее значение stale(), если оно есть, иначе ждут не дольше
+    SINGLE_FLIGHT_WAIT и берут готовый результат через load().
+    Если результата так и нет, значение считается самостоятельно.
+    """
+    lock = get_lock(key)
+    if lock.acquire():
+        try:
+            value = load() if load is not None else None
+            return compute() if value is None else value
+        finally:
+            lock.release()
+    if stale is not None:
+        value = stale()
+        if value is not None:
+            return value
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    while lock.locked() and time.monotonic() < deadline:
+        time.sleep(settings.SINGLE_FLIGHT_POLL)
+    value = load() if load is not None else None
+    return compute() if value is None else value
+
+
+def single_flight(key, stale=None):
+    """Декоратор действия viewset на основе coalesce.
+
+    key и stale - имена методов view, принимающих запрос: ключ
+    пересчёта (None - выполнить действие сразу, например при попадании
+    в кэш) и устаревший ответ. Ожидавшие запросы после освобождения
+    блокировки выполняют действие сами и получают ответ из кэша,
+    заполненного первым запросом.
+    """
+    def decorator(action):
+        @wraps(action)
+        def wrapper(view, request, *args, **kwargs):
+            flight_key = getattr(view, key)(request)
+            run = partial(action, view, request, *args, **kwargs)
+            if flight_key is None:
+                return run()
+            return coalesce(
+                flight_key,
+                run,
+                stale=partial(getattr(view, stale), request) if stale
+                else None
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+from collections import defaultdict
+
+from recipes.models import Recipe, RecipeIngredient
+
+from .loaders import get_subscribed_author_ids
+from .sql_comments import sql_source
+
+# Поля строки рецепта для чтения без сериализатора.
+RECIPE_VALUES = (
+    'id',
+    'author__email',
+    'author__id',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'is_favorited',
+    'is_in_shopping_cart',
+    'name',
+    'image',
+    'text',
+    'cooking_time',
+    'favorites_count',
+    'cart_count',
+)
+
+
+def _recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__color', 'tag__slug'
+    )
+    for recipe_id, tag_id, name, color, slug in rows:
+        tags[recipe_id].append({
+            'id': tag_id,
+            'name': name,
+            'color': color,
+            'slug': slug,
+        })
+    return tags
+
+
+def _recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id',
+        'ingredient__id',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount'
+    )
+    for recipe_id, ingredient_id, name, unit, amount in rows:
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+@sql_source('build_recipes')
+def build_recipes(rows, request):
+    """Представления рецептов из строк values() по схеме RecipeSerializer.
+
+    Теги и ингредиенты всей страницы читаются двумя запросами.
+    """
+    recipe_ids = [row['id'] for row in rows]
+    tags = _recipe_tags(recipe_ids)
+    ingredients = _recipe_ingredients(recipe_ids)
+    subscribed = get_subscribed_author_ids(request)
+    storage = Recipe._meta.get_field('image').storage
+    return [
+        {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': {
+                'email': row['author__email'],
+                'id': row['author__id'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': row['author__id'] in subscribed,
+            },
+            'ingredients': ingredients[row['id']],
+            'is_favorited': bool(row['is_favorited']),
+            'is_in_shopping_cart': bool(row['is_in_shopping_cart']),
+            'name': row['name'],
+            'image': request.build_absolute_uri(
+                storage.url(row['image'])
+            ) if row['image'] else None,
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+            'favorites_count': row['favorites_count'],
+            'cart_count': row['cart_count'],
+        }
+        for row in rows
+    ]
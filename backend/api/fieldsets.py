@@ -0,0 +1,73 @@
+import copy
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+class Fieldset:
+    """Запрошенные поля ответа и раскрываемые вложенные объекты."""
+
+    def __init__(self, fields, expand):
+        self.fields = fields
+        self.expand = expand
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def expanded(self, name):
+        return name in self.fields and name in self.expand
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def parse_fieldset(request, serializer_class):
+    """Набор полей из параметров fields и expand.
+
+    Без параметра fields возвращает None - ответ полный.
+    """
+    fields = _split(request.query_params.get(FIELDS_PARAM, ''))
+    if not fields:
+        return None
+    expand = _split(request.query_params.get(EXPAND_PARAM, ''))
+    unknown = [
+        name for name in fields if name not in serializer_class.Meta.fields
+    ] + [
+        name for name in expand if name not in serializer_class.compact_fields
+    ]
+    if unknown:
+        raise ValidationError(
+            {FIELDS_PARAM: f'Неизвестные поля: {", ".join(unknown)}'}
+        )
+    return Fieldset(
+        tuple(name for name in serializer_class.Meta.fields if name in fields),
+        frozenset(expand)
+    )
+
+
+class SparseFieldsMixin:
+    """Миксин сериализатора с набором полей из context['fieldset'].
+
+    Незапрошенные поля не создаются и не вычисляются, вложенные
+    объекты без expand заменяются полями из compact_fields.
+    """
+    compact_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+        return OrderedDict(
+            (
+                name,
+                copy.deepcopy(self.compact_fields[name])
+                if name in self.compact_fields and not fieldset.expanded(name)
+                else fields[name]
+            )
+            for name in fieldset.fields
+        )
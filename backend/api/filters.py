@@ -1,8 +1,18 @@
-from django.db.models import Q
+from django import forms
+from django.db.models import Exists, OuterRef
 
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.catalogue import get_tag_ids
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.search import search_recipes
+
+from rest_framework.filters import OrderingFilter
+
+
+class IntegerFilter(filters.NumberFilter):
+    """Фильтр по целому числу: дробные значения дают ошибку 400."""
+    field_class = forms.IntegerField
 
 
 class IngredientFilter(FilterSet):
@@ -20,18 +30,23 @@ class IngredientFilter(FilterSet):
         )
 
 
+def tag_choices():
+    """Варианты фильтра тегов из кэша справочника."""
+    return [(slug, slug) for slug in get_tag_ids()]
+
+
 class RecipeFilter(FilterSet):
     """Класс фильтрации рецептов."""
-    author = filters.AllValuesFilter(field_name='author')
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug',
+    author = IntegerFilter(field_name='author_id')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -39,24 +54,64 @@ class RecipeFilter(FilterSet):
             'author',
             'tags',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search'
         )
 
-    def _filter(self, queryset, name, value, param):
-        """Главная функция для проверки."""
-        if self.request.user.is_authenticated:
-            if value:
-                return queryset.filter(
-                    **{f'{param}__user': self.request.user})
-            if not value:
-                return queryset.filter(
-                    ~Q(**{f'{param}__user': self.request.user}))
-        return queryset
+    def _filter(self, queryset, value, model):
+        """Главная функция для проверки наличия отметки пользователя."""
+        if not self.request.user.is_authenticated:
+            return queryset
+        marked = Exists(model.objects.filter(
+            user=self.request.user,
+            recipe=OuterRef('pk')
+        ))
+        return queryset.filter(marked if value else ~marked)
 
     def filter_is_favorited(self, queryset, name, value):
         """Функция фильтрации-проверки на наличе в избранном."""
-        return self._filter(queryset, name, value, param='favorite')
+        return self._filter(queryset, value, Favorite)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Функция фильтрации-проверки на наличе в корзине."""
-        return self._filter(queryset, name, value, param='cart')
+        return self._filter(queryset, value, ShoppingCart)
+
+    def filter_tags(self, queryset, name, value):
+        """Функция фильтрации по любому из тегов без соединения таблиц."""
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tag_ids[slug] for slug in value if slug in tag_ids]
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Функция полнотекстового поиска по рецептам."""
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Класс сортировки рецептов.
+
+    Без явного параметра ordering результаты поиска
+    сортируются по релевантности. В курсорном режиме сортировка
+    остаётся по id: позиция курсора строится по полям строки,
+    а дробная релевантность для этого не подходит.
+    """
+
+    def use_cursor(self, request, view):
+        use_cursor = getattr(view.paginator, 'use_cursor', None)
+        return use_cursor is not None and use_cursor(request, view)
+
+    def get_ordering(self, request, queryset, view):
+        if (
+            self.ordering_param not in request.query_params
+            and 'search_rank' in queryset.query.annotations
+            and not self.use_cursor(request, view)
+        ):
+            return ('-search_rank', '-id')
+        return super().get_ordering(request, queryset, view)
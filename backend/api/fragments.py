@@ -0,0 +1,89 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import RecipeIngredient
+
+from .loaders import get_subscribed_author_ids
+from .sql_comments import sql_source
+
+FRAGMENT_KEY = 'recipe-fragment:{}:{}:{}'
+
+# Поля, зависящие от пользователя или часто меняющиеся счётчики:
+# в кэш не попадают и подставляются при каждом ответе.
+VIEWER_FIELDS = (
+    'is_favorited',
+    'is_in_shopping_cart',
+    'favorites_count',
+    'cart_count',
+)
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_fragment_cache():
+    """Кэш фрагментов или None, если кэширование отключено."""
+    if not settings.RECIPE_FRAGMENT_CACHE:
+        return None
+    return caches[settings.RECIPE_FRAGMENT_CACHE]
+
+
+def get_fragment_stats():
+    """Число попаданий и промахов кэша фрагментов в этом процессе."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(hits, misses):
+    with _stats_lock:
+        _stats['hits'] += hits
+        _stats['misses'] += misses
+
+
+@sql_source('render_recipes')
+def render_recipes(serializer, recipes):
+    """Представления рецептов из кэша фрагментов.
+
+    Одинаковая для всех пользователей часть ответа берётся из кэша
+    по id и версии рецепта, связанные объекты подгружаются только
+    для промахов. Флаги пользователя и счётчики подставляются
+    поверх фрагментов.
+    """
+    request = serializer.context['request']
+    cache = get_fragment_cache()
+    # Адрес изображения абсолютный, поэтому ключ зависит от хоста.
+    base_url = request.build_absolute_uri('/')
+    keys = {
+        recipe.pk: FRAGMENT_KEY.format(base_url, recipe.pk, recipe.version)
+        for recipe in recipes
+    }
+    fragments = cache.get_many(keys.values()) if cache else {}
+    misses = [recipe for recipe in recipes if keys[recipe.pk] not in fragments]
+    if misses:
+        prefetch_related_objects(
+            misses,
+            'author',
+            'tags',
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+        rendered = {
+            keys[recipe.pk]: serializer.render_fragment(recipe)
+            for recipe in misses
+        }
+        if cache:
+            cache.set_many(rendered)
+        fragments.update(rendered)
+    _count(len(recipes) - len(misses), len(misses))
+    subscribed = get_subscribed_author_ids(request)
+    return [
+        serializer.overlay(fragments[keys[recipe.pk]], recipe, subscribed)
+        for recipe in recipes
+    ]
@@ -0,0 +1,152 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count
+
+from recipes.catalogue import get_catalogue_version
+from recipes.models import Ingredient, RecipeIngredient
+
+MIN_FUZZY_QUERY_LENGTH = 3
+# Поиск с опечаткой перебирает варианты запроса, число которых растёт
+# с его длиной, поэтому для длинных запросов он не выполняется.
+MAX_FUZZY_QUERY_LENGTH = 32
+MAX_QUERY_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def normalize(value):
+    """Приведение строки к виду для поиска без учёта регистра и ё."""
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def edits(query, alphabet):
+    """Все строки на расстоянии одной правки от запроса."""
+    splits = [(query[:position], query[position:])
+              for position in range(len(query) + 1)]
+    for left, right in splits:
+        if right:
+            yield left + right[1:]
+            for char in alphabet:
+                yield left + char + right[1:]
+        if len(right) > 1:
+            yield left + right[1] + right[0] + right[2:]
+        for char in alphabet:
+            yield left + char + right
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Результаты ранжируются: совпадения по началу названия, затем по
+    подстроке, затем с одной опечаткой в начале названия (поиск по
+    началу для всех вариантов запроса на расстоянии одной правки). Внутри
+    группы - по частоте использования в рецептах и по названию.
+    """
+
+    def __init__(self, ingredients, usage=None):
+        usage = usage or {}
+        self.entries = sorted(
+            (
+                normalize(item['name']),
+                -usage.get(item['id'], 0),
+                item['id'],
+                item
+            )
+            for item in ingredients
+        )
+        self.keys = [entry[0] for entry in self.entries]
+        self.alphabet = sorted(set(''.join(self.keys)))
+
+    def _prefix_matches(self, query):
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.keys)
+            and self.keys[position].startswith(query)
+        ):
+            yield self.entries[position]
+            position += 1
+
+    def search(self, query, measurement_unit=None):
+        """Поиск ингредиентов по началу названия с ранжированием.
+
+        Запрос обрезается до максимальной длины названия ингредиента.
+        """
+        query = normalize(query[:MAX_QUERY_LENGTH])
+        if not query:
+            groups = [self.entries]
+        else:
+            prefix = list(self._prefix_matches(query))
+            seen = {entry[2] for entry in prefix}
+            substring = [
+                entry for entry in self.entries
+                if entry[2] not in seen and query in entry[0]
+            ]
+            seen.update(entry[2] for entry in substring)
+            fuzzy = {}
+            if (
+                MIN_FUZZY_QUERY_LENGTH
+                <= len(query)
+                <= MAX_FUZZY_QUERY_LENGTH
+            ):
+                for variant in set(edits(query, self.alphabet)):
+                    for entry in self._prefix_matches(variant):
+                        if entry[2] not in seen:
+                            fuzzy[entry[2]] = entry
+            groups = [prefix, substring, sorted(fuzzy.values())]
+        return [
+            item
+            for group in groups
+            for *_, item in sorted(group, key=lambda entry: entry[1])
+            if measurement_unit is None
+            or item['measurement_unit'] == measurement_unit
+        ]
+
+
+# Индекс процесса: сам индекс, версия справочника и время построения.
+_index = {'index': None, 'version': None, 'built_at': 0}
+_index_lock = threading.Lock()
+
+
+def build_ingredient_index():
+    """Загрузка индекса из базы данных."""
+    usage = None
+    if settings.INGREDIENT_INDEX_USAGE_RANKING:
+        usage = dict(
+            RecipeIngredient.objects.values('ingredient').annotate(
+                total=Count('id')
+            ).values_list('ingredient', 'total').order_by()
+        )
+    return IngredientIndex(
+        Ingredient.objects.values('id', 'name', 'measurement_unit'),
+        usage
+    )
+
+
+def _index_is_fresh(version):
+    """Проверка, что индекс построен для версии и не устарел по TTL."""
+    return (
+        _index['index'] is not None
+        and _index['version'] == version
+        and time.monotonic() - _index['built_at']
+        < settings.INGREDIENT_INDEX_TTL
+    )
+
+
+def get_ingredient_index():
+    """Индекс ингредиентов, актуальный для текущей версии справочника.
+
+    Индекс перестраивается при смене версии справочника, а также по
+    истечении INGREDIENT_INDEX_TTL для обновления частоты использования.
+    """
+    version = get_catalogue_version('ingredients')
+    if _index_is_fresh(version):
+        return _index['index']
+    with _index_lock:
+        if not _index_is_fresh(version):
+            _index.update(
+                index=build_ingredient_index(),
+                version=version,
+                built_at=time.monotonic()
+            )
+        return _index['index']
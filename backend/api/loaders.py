@@ -0,0 +1,26 @@
+from users.models import Subscribe
+
+from .sql_comments import sql_source
+
+
+def get_subscribed_author_ids(request):
+    """Множество id авторов, на которых подписан текущий пользователь.
+
+    Выборка выполняется одним запросом и кэшируется на объекте запроса,
+    поэтому все сериализаторы в рамках запроса получают ответ из памяти.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if getattr(request, '_subscribed_author_ids', None) is None:
+        with sql_source('get_subscribed_author_ids'):
+            request._subscribed_author_ids = frozenset(
+                Subscribe.objects.filter(
+                    user=request.user
+                ).values_list('author_id', flat=True)
+            )
+    return request._subscribed_author_ids
+
+
+def reset_subscribed_author_ids(request):
+    """Сброс кэша подписок после их изменения в рамках запроса."""
+    request.__dict__.pop('_subscribed_author_ids', None)
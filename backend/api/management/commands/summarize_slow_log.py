@@ -0,0 +1,108 @@
+import json
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    """Значение перцентиля отсортированного списка."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(groups):
+    """Сводка по группам: число, суммарное, p50, p95 и максимальное время."""
+    rows = []
+    for key, entries in groups.items():
+        durations = sorted(entry['milliseconds'] for entry in entries)
+        rows.append({
+            'key': key,
+            'count': len(entries),
+            'total': sum(durations),
+            'p50': percentile(durations, 0.5),
+            'p95': percentile(durations, 0.95),
+            'max': durations[-1],
+            'entries': entries,
+        })
+    return sorted(rows, key=lambda row: -row['total'])
+
+
+class Command(BaseCommand):
+    """Служебная команда сводки журнала медленных запросов."""
+    help = 'Сводка журнала медленных запросов по действиям и SQL запросам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.SLOW_LOG_PATH,
+            type=Path,
+            help='Путь к журналу'
+        )
+        parser.add_argument(
+            '--top',
+            default=20,
+            type=int,
+            help='Число строк в каждой сводке'
+        )
+
+    def read(self, path):
+        """Записи журнала, некорректные строки пропускаются."""
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def write_rows(self, title, rows, top, details):
+        self.stdout.write(f'\n{title}')
+        self.stdout.write(
+            f'{"count":>7} {"total ms":>11} {"p50":>9} {"p95":>9} '
+            f'{"max":>9}  key'
+        )
+        for row in rows[:top]:
+            self.stdout.write(
+                f'{row["count"]:>7} {row["total"]:>11.1f} '
+                f'{row["p50"]:>9.1f} {row["p95"]:>9.1f} '
+                f'{row["max"]:>9.1f}  {row["key"]}'
+            )
+            self.stdout.write(f'{"":>50}{details(row["entries"])}')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        requests = defaultdict(list)
+        statements = defaultdict(list)
+        dropped = 0
+        for entry in self.read(path):
+            dropped += entry.get('dropped', 0)
+            if entry.get('type') == 'request':
+                requests[
+                    f'{entry["method"]} {entry["endpoint"]}'
+                ].append(entry)
+            elif entry.get('type') == 'query':
+                statements[entry['statement']].append(entry)
+        self.stdout.write(
+            f'Медленных запросов к API: '
+            f'{sum(map(len, requests.values()))}, медленных SQL запросов: '
+            f'{sum(map(len, statements.values()))}, '
+            f'отброшено ограничением частоты: {dropped}'
+        )
+        self.write_rows(
+            'Действия API',
+            summarize(requests),
+            options['top'],
+            lambda entries: 'SQL запросов в среднем: {:.1f}'.format(
+                sum(entry['queries'] for entry in entries) / len(entries)
+            )
+        )
+        self.write_rows(
+            'SQL запросы',
+            summarize(statements),
+            options['top'],
+            lambda entries: 'действия: ' + ', '.join(sorted({
+                entry['endpoint'] for entry in entries
+            }))
+        )
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .fragments import get_fragment_stats
+
+# Границы корзин гистограммы времени ответа, секунды.
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+def endpoint_name(request):
+    """Имя обработчика запроса: класс view и действие viewset."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = match.func
+    view_class = getattr(view, 'cls', None)
+    if view_class is None:
+        return getattr(view, '__name__', 'unknown')
+    action = (getattr(view, 'actions', None) or {}).get(
+        request.method.lower()
+    )
+    if action:
+        return f'{view_class.__name__}.{action}'
+    return view_class.__name__
+
+
+class QueryStats:
+    """Обёртка execute_wrapper, считающая запросы к базе и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsRegistry:
+    """Метрики запросов процесса.
+
+    Накапливаются в памяти и раз в METRICS_FLUSH_INTERVAL секунд
+    записываются в файл процесса в METRICS_DIR, откуда их собирает
+    load_metrics() для всех воркеров gunicorn.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.flushed_at = time.monotonic()
+
+    def record(self, endpoint, method, status, duration, queries,
+               query_seconds, size):
+        with self.lock:
+            item = self.endpoints.get(f'{endpoint}|{method}')
+            if item is None:
+                item = self.endpoints[f'{endpoint}|{method}'] = {
+                    'count': 0,
+                    'duration': 0.0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                    'queries': 0,
+                    'query_seconds': 0.0,
+                    'bytes': 0,
+                    'statuses': {},
+                }
+            item['count'] += 1
+            item['duration'] += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    item['buckets'][index] += 1
+            item['queries'] += queries
+            item['query_seconds'] += query_seconds
+            item['bytes'] += size
+            status_class = f'{status // 100}xx'
+            item['statuses'][status_class] = (
+                item['statuses'].get(status_class, 0) + 1
+            )
+        if time.monotonic() - self.flushed_at >= (
+            settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        """Запись метрик процесса в его файл."""
+        with self.lock:
+            data = json.dumps({
+                'endpoints': self.endpoints,
+                'fragments': get_fragment_stats(),
+            })
+            self.flushed_at = time.monotonic()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(data)
+        os.replace(temporary, path)
+
+
+registry = MetricsRegistry()
+
+
+def load_metrics():
+    """Сумма метрик всех процессов из файлов METRICS_DIR."""
+    endpoints = {}
+    fragments = {'hits': 0, 'misses': 0}
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for key, value in data['fragments'].items():
+            fragments[key] += value
+        for key, item in data['endpoints'].items():
+            total = endpoints.get(key)
+            if total is None:
+                endpoints[key] = item
+                continue
+            for field in ('count', 'duration', 'queries', 'query_seconds',
+                          'bytes'):
+                total[field] += item[field]
+            total['buckets'] = [
+                left + right
+                for left, right in zip(total['buckets'], item['buckets'])
+            ]
+            for status_class, count in item['statuses'].items():
+                total['statuses'][status_class] = (
+                    total['statuses'].get(status_class, 0) + count
+                )
+    return endpoints, fragments
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    )
+
+
+def render_prometheus(endpoints, fragments):
+    """Метрики в текстовом формате Prometheus."""
+    lines = [
+        '# HELP foodgram_request_duration_seconds Время ответа.',
+        '# TYPE foodgram_request_duration_seconds histogram',
+    ]
+    for key, item in sorted(endpoints.items()):
+        endpoint, method = key.split('|')
+        labels = _labels(endpoint=endpoint, method=method)
+        for bound, count in zip(DURATION_BUCKETS, item['buckets']):
+            lines.append(
+                'foodgram_request_duration_seconds_bucket'
+                f'{{{labels},le="{bound}"}} {count}'
+            )
+        lines.extend((
+            'foodgram_request_duration_seconds_bucket'
+            f'{{{labels},le="+Inf"}} {item["count"]}',
+            f'foodgram_request_duration_seconds_sum{{{labels}}} '
+            f'{item["duration"]}',
+            f'foodgram_request_duration_seconds_count{{{labels}}} '
+            f'{item["count"]}',
+        ))
+    counters = (
+        ('foodgram_db_queries_total', 'queries', 'Запросы к базе данных.'),
+        ('foodgram_db_query_seconds_total', 'query_seconds',
+         'Время запросов к базе данных.'),
+        ('foodgram_response_bytes_total', 'bytes', 'Размер ответов.'),
+    )
+    for name, field, description in counters:
+        lines.extend((
+            f'# HELP {name} {description}',
+            f'# TYPE {name} counter',
+        ))
+        for key, item in sorted(endpoints.items()):
+            endpoint, method = key.split('|')
+            labels = _labels(endpoint=endpoint, method=method)
+            lines.append(f'{name}{{{labels}}} {item[field]}')
+    lines.extend((
+        '# HELP foodgram_responses_total Ответы по классам статусов.',
+        '# TYPE foodgram_responses_total counter',
+    ))
+    for key, item in sorted(endpoints.items()):
+        endpoint, method = key.split('|')
+        for status_class, count in sorted(item['statuses'].items()):
+            labels = _labels(
+                endpoint=endpoint,
+                method=method,
+                status=status_class
+            )
+            lines.append(f'foodgram_responses_total{{{labels}}} {count}')
+    lines.extend((
+        '# HELP foodgram_recipe_fragment_cache_total Обращения к кэшу '
+        'фрагментов рецептов.',
+        '# TYPE foodgram_recipe_fragment_cache_total counter',
+    ))
+    for result, count in sorted(fragments.items()):
+        lines.append(
+            f'foodgram_recipe_fragment_cache_total{{result="{result}"}} '
+            f'{count}'
+        )
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,164 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers
+
+from .metrics import QueryStats, endpoint_name, registry
+from .profiling import is_profiling_requested, profile_response
+from .slow_log import SlowQueryLogger, log_slow_request
+from .sql_comments import SqlCommenter
+
+
+def stream_with_wrapper(content, wrapper):
+    """Потоковый ответ, запросы которого проходят через wrapper.
+
+    Запросы итератора потокового ответа выполняются при его отправке,
+    уже после выхода из middleware, поэтому обёртка подключается
+    заново на получение каждой части ответа.
+    """
+    iterator = iter(content)
+    while True:
+        with connection.execute_wrapper(wrapper):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class MetricsMiddleware:
+    """Сбор метрик времени ответа, запросов к базе и размера ответа."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        endpoint = endpoint_name(request)
+        if response.streaming:
+            response.streaming_content = self.record_streamed(
+                stream_with_wrapper(response.streaming_content, stats),
+                request,
+                response,
+                endpoint,
+                stats,
+                start
+            )
+            return response
+        registry.record(
+            endpoint,
+            request.method,
+            response.status_code,
+            time.perf_counter() - start,
+            stats.count,
+            stats.seconds,
+            len(response.content)
+        )
+        return response
+
+    def record_streamed(self, content, request, response, endpoint, stats,
+                        start):
+        """Метрики потокового ответа записываются после его отправки."""
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.record(
+                endpoint,
+                request.method,
+                response.status_code,
+                time.perf_counter() - start,
+                stats.count,
+                stats.seconds,
+                size
+            )
+
+
+class SlowLogMiddleware:
+    """Запись медленных запросов и медленных SQL запросов в журнал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_LOG_ENABLED:
+            return self.get_response(request)
+        queries = SlowQueryLogger(request, endpoint_name)
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.log_streamed(
+                stream_with_wrapper(response.streaming_content, queries),
+                request,
+                response,
+                queries,
+                start
+            )
+            return response
+        log_slow_request(
+            request,
+            response,
+            endpoint_name(request),
+            time.perf_counter() - start,
+            queries.count
+        )
+        return response
+
+    def log_streamed(self, content, request, response, queries, start):
+        """Потоковый ответ проверяется после его отправки."""
+        try:
+            yield from content
+        finally:
+            log_slow_request(
+                request,
+                response,
+                endpoint_name(request),
+                time.perf_counter() - start,
+                queries.count
+            )
+
+
+class SqlCommentMiddleware:
+    """Пометка SQL запросов комментарием с маршрутом и действием."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SQL_COMMENTS_ENABLED:
+            return self.get_response(request)
+        commenter = SqlCommenter(request, endpoint_name)
+        with connection.execute_wrapper(commenter):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = stream_with_wrapper(
+                response.streaming_content,
+                commenter
+            )
+        return response
+
+
+class ProfilingMiddleware:
+    """Отчёт профилировщика вместо ответа по флагу ?profile для персонала."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiling_requested(request):
+            return self.get_response(request)
+        response = JsonResponse(
+            profile_response(request, self.get_response),
+            json_dumps_params={'ensure_ascii': False, 'indent': 2}
+        )
+        add_never_cache_headers(response)
+        return response
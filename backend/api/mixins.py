@@ -1,4 +1,29 @@
-from rest_framework import mixins, viewsets
+import gzip
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, urlencode
+
+from recipes.catalogue import get_catalogue_version
+
+from rest_framework import mixins, status, viewsets
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .coalescing import coalesce
+from .fast_read import RECIPE_VALUES, build_recipes
+from .fieldsets import FIELDS_PARAM
+from .renderers import FastJSONRenderer
+
+CATALOGUE_SNAPSHOT_KEY = 'catalogue-snapshot:{}:{}'
+ANONYMOUS_LIST_KEY = 'anonymous-list:{}:{}:{}'
+ANONYMOUS_LIST_STALE_KEY = 'anonymous-list-stale:{}:{}'
+# Во сколько раз устаревшая копия списка живёт дольше актуальной.
+STALE_TIMEOUT_FACTOR = 10
 
 
 class FavoriteViewSet(
@@ -8,3 +33,243 @@ class FavoriteViewSet(
 ):
     """Миксин модель для Избранного."""
     pass
+
+
+def accepts_gzip(accept_encoding):
+    """Проверка, что клиент принимает gzip, с учётом q-значений.
+
+    Явное значение для gzip важнее значения для *, q=0 означает отказ.
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+class CatalogueSnapshotMixin:
+    """Миксин отдачи справочника готовым JSON с ETag.
+
+    Список без параметров запроса рендерится один раз на версию
+    справочника (recipes.catalogue) и хранится в общем кэше вместе
+    со сжатой gzip копией. Запрос с совпадающим If-None-Match получает
+    304 без обращения к базе данных.
+    """
+    catalogue_name = None
+    _snapshots = {}
+
+    def perform_authentication(self, request):
+        """Пользователь определяется лениво, только при обращении."""
+        pass
+
+    def get_snapshot(self, version):
+        """Готовое тело ответа и его gzip копия для версии справочника."""
+        snapshot = self._snapshots.get(self.catalogue_name)
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot[1]
+        key = CATALOGUE_SNAPSHOT_KEY.format(self.catalogue_name, version)
+        bodies = cache.get(key)
+        if bodies is None:
+            # Новую версию собирает один воркер, остальные ждут её
+            # в кэше: устаревшее тело не совпало бы с ETag версии.
+            bodies = coalesce(
+                key,
+                partial(self.build_snapshot, key),
+                load=partial(cache.get, key)
+            )
+        self._snapshots[self.catalogue_name] = (version, bodies)
+        return bodies
+
+    def build_snapshot(self, key):
+        """Сборка и сохранение тела ответа справочника."""
+        serializer = self.get_serializer(
+            self.filter_queryset(self.get_queryset()),
+            many=True
+        )
+        body = JSONRenderer().render(serializer.data)
+        bodies = (body, gzip.compress(body))
+        cache.set(key, bodies, None)
+        return bodies
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        version = get_catalogue_version(self.catalogue_name)
+        gzipped = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        # У сжатого и несжатого тела разные ETag: это разные
+        # представления одного ресурса.
+        etag = '"{}-{}{}"'.format(
+            self.catalogue_name,
+            version,
+            '-gz' if gzipped else ''
+        )
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            body, compressed = self.get_snapshot(version)
+            response = HttpResponse(
+                compressed if gzipped else body,
+                content_type='application/json'
+            )
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, no-cache'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class AnonymousListCacheMixin:
+    """Миксин кэширования списка для анонимных пользователей.
+
+    Данные ответа хранятся в общем кэше по нормализованным параметрам
+    запроса и поколению list_cache_name (recipes.catalogue), которое
+    меняется при записи рецептов, их ингредиентов и тегов. Счётчики
+    в ответе могут отставать не дольше ANONYMOUS_LIST_CACHE_TIMEOUT.
+
+    Для single_flight миксин даёт ключ пересчёта при промахе
+    (get_list_flight_key) и копию прошлого поколения (get_stale_list).
+    """
+    list_cache_name = None
+
+    def use_list_cache(self, request):
+        """Кэшируются только запросы анонимных пользователей."""
+        return (
+            settings.ANONYMOUS_LIST_CACHE_TIMEOUT
+            and not request.user.is_authenticated
+        )
+
+    def get_list_digest(self, request):
+        """Хэш адреса сайта и отсортированных параметров запроса."""
+        query = urlencode(sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+        ), doseq=True)
+        return hashlib.md5(
+            f'{request.build_absolute_uri("/")}?{query}'.encode()
+        ).hexdigest()
+
+    def get_cached_list(self, request):
+        """Ключ кэша и сохранённые данные, читаются раз за запрос."""
+        if not hasattr(self, '_cached_list'):
+            key = ANONYMOUS_LIST_KEY.format(
+                self.list_cache_name,
+                get_catalogue_version(self.list_cache_name),
+                self.get_list_digest(request)
+            )
+            self._cached_list = (key, cache.get(key))
+        return self._cached_list
+
+    def get_list_flight_key(self, request):
+        if not self.use_list_cache(request):
+            return None
+        key, data = self.get_cached_list(request)
+        if data is not None:
+            return None
+        # После ожидания список читается из кэша заново.
+        del self._cached_list
+        return key
+
+    def get_stale_list(self, request):
+        data = cache.get(ANONYMOUS_LIST_STALE_KEY.format(
+            self.list_cache_name,
+            self.get_list_digest(request)
+        ))
+        if data is None:
+            return None
+        return self.finalize_list_response(Response(data))
+
+    def finalize_list_response(self, response):
+        """Заголовки кэширования для nginx и браузеров."""
+        if self.use_list_cache(self.request):
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.ANONYMOUS_LIST_CACHE_TIMEOUT
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_list_cache(request):
+            return self.finalize_list_response(
+                super().list(request, *args, **kwargs)
+            )
+        key, data = self.get_cached_list(request)
+        if data is not None:
+            return self.finalize_list_response(Response(data))
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        timeout = settings.ANONYMOUS_LIST_CACHE_TIMEOUT
+        cache.set(key, response.data, timeout)
+        cache.set(
+            ANONYMOUS_LIST_STALE_KEY.format(
+                self.list_cache_name,
+                self.get_list_digest(request)
+            ),
+            response.data,
+            timeout * STALE_TIMEOUT_FACTOR
+        )
+        return self.finalize_list_response(response)
+
+
+class FastRecipeReadMixin:
+    """Миксин чтения рецептов без сериализатора.
+
+    При RECIPE_FAST_READ список и рецепт собираются из values()
+    функцией build_recipes и рендерятся через FastJSONRenderer.
+    Фильтры, сортировка и разбиение на страницы те же, что у
+    сериализатора, в том числе для страницы рецепта. Запросы
+    с параметром fields обрабатывает сериализатор.
+    """
+
+    def use_fast_read(self):
+        return (
+            settings.RECIPE_FAST_READ
+            and self.action in ('list', 'retrieve')
+            and FIELDS_PARAM not in self.request.query_params
+        )
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if settings.RECIPE_FAST_READ and getattr(
+            self, 'action', None
+        ) in ('list', 'retrieve'):
+            return [FastJSONRenderer(), *renderers]
+        return renderers
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_read():
+            return super().list(request, *args, **kwargs)
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *RECIPE_VALUES
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                build_recipes(list(page), request)
+            )
+        return Response(build_recipes(list(rows), request))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_read():
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            rows = list(self.filter_queryset(self.get_queryset()).filter(
+                pk=kwargs[self.lookup_url_kwarg or self.lookup_field]
+            ).values(*RECIPE_VALUES))
+        except (TypeError, ValueError):
+            rows = None
+        if not rows:
+            raise Http404
+        return Response(build_recipes(rows, request)[0])
@@ -1,6 +1,59 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class IdCursorPagination(CursorPagination):
+    """Курсорное разбиение на страницы по id без COUNT и OFFSET."""
+    ordering = '-id'
+    page_size_query_param = 'limit'
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
-    """Пользовательский класс разбиения на страницы."""
+    """Пользовательский класс разбиения на страницы.
+
+    Для действий из cursor_pagination_actions view поддерживает
+    курсорный режим: он включается параметром pagination=cursor,
+    наличием параметра cursor или настройкой PAGINATION_MODE.
+    """
     page_size_query_param = 'limit'
+    cursor_paginator = None
+
+    def use_cursor(self, request, view):
+        """Функция выбора курсорного режима для запроса."""
+        if getattr(view, 'action', None) not in getattr(
+            view, 'cursor_pagination_actions', ()
+        ):
+            return False
+        mode = request.query_params.get('pagination')
+        if mode is None:
+            if IdCursorPagination.cursor_query_param in request.query_params:
+                return True
+            if self.page_query_param in request.query_params:
+                return False
+            mode = settings.PAGINATION_MODE
+        return mode == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request, view):
+            self.cursor_paginator = IdCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,166 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .sql_comments import normalize_sql
+
+PROFILE_PARAM = 'profile'
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+
+def is_profiling_requested(request):
+    """Проверка флага профилирования и прав сотрудника.
+
+    Пользователь определяется аутентификацией DRF, так как API
+    работает по токену, а не по сессии.
+    """
+    if (
+        not settings.REQUEST_PROFILING
+        or PROFILE_PARAM not in request.GET
+        or not request.path.startswith('/api/')
+    ):
+        return False
+    try:
+        user = Request(request, authenticators=[
+            authenticator()
+            for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ]).user
+    except APIException:
+        return False
+    return user.is_staff
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, записывающая запросы и их время."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'seconds': time.perf_counter() - start,
+            })
+
+
+def explain(sql, params):
+    """План выполнения запроса на чтение или текст ошибки.
+
+    На PostgreSQL запрос выполняется повторно (ANALYZE), поэтому
+    запросы на изменение данных не разбираются.
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f'Ошибка: {error}']
+
+
+def profile_stats(profiler):
+    """Текстовая сводка cProfile по накопленному времени."""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(
+        'cumulative'
+    ).print_stats(settings.PROFILE_TOP_FUNCTIONS)
+    return stream.getvalue().splitlines()
+
+
+def query_report(queries):
+    """Запросы с планами и группы повторов, отличных только параметрами.
+
+    План строится один раз для каждого шаблона запроса, не более
+    PROFILE_EXPLAIN_LIMIT шаблонов. Параметры в отчёт не попадают.
+    """
+    groups = defaultdict(list)
+    for index, query in enumerate(queries):
+        groups[normalize_sql(query['sql'])].append(index)
+    plans = {}
+    for statement, indexes in list(groups.items())[
+        :settings.PROFILE_EXPLAIN_LIMIT
+    ]:
+        query = queries[indexes[0]]
+        if not query['many']:
+            plans[statement] = explain(query['sql'], query['params'])
+    report = []
+    for query in queries:
+        statement = normalize_sql(query['sql'])
+        report.append({
+            'sql': query['sql'],
+            'milliseconds': round(query['seconds'] * 1000, 3),
+            'repeats': len(groups[statement]),
+            'explain': plans.pop(statement, None),
+        })
+    duplicates = sorted(
+        (
+            {
+                'statement': statement,
+                'count': len(indexes),
+                'milliseconds': round(sum(
+                    queries[index]['seconds'] for index in indexes
+                ) * 1000, 3),
+            }
+            for statement, indexes in groups.items()
+            if len(indexes) >= settings.PROFILE_DUPLICATE_THRESHOLD
+        ),
+        key=lambda item: -item['count']
+    )
+    return report, duplicates
+
+
+def profile_response(request, get_response):
+    """Выполнение запроса под профилировщиком и отчёт в формате JSON.
+
+    Отчёт заменяет ответ и содержит его статус и тело, если ответ
+    в формате JSON.
+    """
+    recorder = QueryRecorder()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    with connection.execute_wrapper(recorder):
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration = time.perf_counter() - start
+    queries, duplicates = query_report(recorder.queries)
+    report = {
+        'status': response.status_code,
+        'milliseconds': round(duration * 1000, 3),
+        'query_count': len(queries),
+        'query_milliseconds': round(
+            sum(query['milliseconds'] for query in queries), 3
+        ),
+        'duplicates': duplicates,
+        'queries': queries,
+        'profile': profile_stats(profiler),
+    }
+    if (
+        not response.streaming
+        and response.get('Content-Type', '').startswith('application/json')
+    ):
+        report['response'] = json.loads(response.content or 'null')
+    return report
@@ -0,0 +1,29 @@
+import orjson
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON рендерер на orjson.
+
+    Нестроковые ключи (номера элементов в ошибках ListField)
+    приводятся к строкам, как в json. При запросе отступов работает
+    как JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(
+            accepted_media_type or '',
+            renderer_context or {}
+        ):
+            return super().render(
+                data,
+                accepted_media_type,
+                renderer_context
+            )
+        return orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS
+        )
@@ -1,14 +1,25 @@
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
 from djoser.serializers import UserSerializer
 
 from drf_extra_fields.fields import Base64ImageField
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.search import update_search_vectors
+from recipes.services import rebuild_shopping_lists_for_recipe
 
 from rest_framework import serializers
 
 from users.models import Subscribe, User
 
+from .fieldsets import SparseFieldsMixin
+from .fragments import VIEWER_FIELDS, render_recipes
+from .loaders import get_subscribed_author_ids
+from .sql_comments import sql_source
+
 
 class UserSerializer(UserSerializer):
     """Сериализатор пользователей."""
@@ -27,15 +38,7 @@ class UserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """"Функция проверки на наличия в подписках."""
-        if (
-            self.context.get('request')
-            and not self.context['request'].user.is_anonymous
-        ):
-            return Subscribe.objects.filter(
-                user=self.context['request'].user,
-                author=obj
-            ).exists()
-        return False
+        return obj.id in get_subscribed_author_ids(self.context.get('request'))
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -83,6 +86,26 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeIngredientCompactSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиентов рецепта в сжатом виде."""
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = (
+            'id',
+            'amount'
+        )
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Сериализатор позиций итогового списка покупок."""
+    id = serializers.IntegerField(source='ingredient')
+    name = serializers.CharField()
+    measurement_unit = serializers.CharField()
+    amount = serializers.IntegerField()
+
+
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов при создании рецепта."""
     id = serializers.IntegerField()
@@ -140,19 +163,62 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Ингредиенты должны быть уникальны.'
             )
+        missing_ids = unique_ingredient_id_list - set(
+            Ingredient.objects.in_bulk(unique_ingredient_id_list)
+        )
+        if missing_ids:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                + ', '.join(map(str, sorted(missing_ids)))
+            )
         return obj
 
-    def tags_and_ingredients_set(self, recipe, tags, ingredients):
-        """Создание связей ингредиентов и тегов с рецептом."""
-        recipe.tags.set(tags)
+    def ingredients_create(self, recipe, ingredients):
+        """Создание связей ингредиентов с рецептом."""
         RecipeIngredient.objects.bulk_create(
             [RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def ingredients_update(self, recipe, ingredients):
+        """Обновление только изменившихся связей ингредиентов с рецептом.
+
+        Возвращает id ингредиентов, кол-во которых в рецепте изменилось.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredient.all()
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        removed_ids = current.keys() - amounts.keys()
+        changed = [
+            current[ingredient_id]
+            for ingredient_id in current.keys() & amounts.keys()
+            if current[ingredient_id].amount != amounts[ingredient_id]
+        ]
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        added = [
+            item for item in ingredients if item['id'] not in current
+        ]
+        if removed_ids:
+            RecipeIngredient.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed_ids
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        self.ingredients_create(recipe, added)
+        return (
+            removed_ids
+            | {item.ingredient_id for item in changed}
+            | {item['id'] for item in added}
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         """Функция создания рецепта."""
         tags = validated_data.pop('tags')
@@ -161,9 +227,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             author=self.context['request'].user,
             **validated_data
         )
-        self.tags_and_ingredients_set(recipe, tags, ingredients)
+        recipe.tags.set(tags)
+        self.ingredients_create(recipe, ingredients)
+        update_search_vectors([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Функция обновления рецепта."""
         instance.image = validated_data.get('image', instance.image)
@@ -173,32 +242,70 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
             instance.cooking_time
         )
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredient.objects.filter(
-            recipe=instance,
-            ingredient__in=instance.ingredients.all()
-        ).delete()
-        self.tags_and_ingredients_set(instance, tags, ingredients)
-        instance.save()
+        instance.tags.set(validated_data.pop('tags'))
+        changed_ids = self.ingredients_update(
+            instance,
+            validated_data.pop('ingredients')
+        )
+        instance.save(
+            update_fields=['image', 'name', 'text', 'cooking_time']
+        )
+        update_search_vectors([instance.id])
+        if changed_ids:
+            rebuild_shopping_lists_for_recipe(instance, changed_ids)
         return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related().with_user_flags(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeSerializer(instance, context=self.context).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов из кэша фрагментов."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        fieldset = self.child.context.get('fieldset')
+        if fieldset is None:
+            return render_recipes(self.child, data)
+        prefetch_related_objects(
+            data,
+            *self.child.get_sparse_prefetches(fieldset)
+        )
+        return [self.child.to_representation(item) for item in data]
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор просмотра рецептов."""
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True,
         read_only=True,
-        source='recipe'
+        source='recipe_ingredient'
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    compact_fields = {
+        'author': serializers.IntegerField(
+            source='author_id',
+            read_only=True
+        ),
+        'tags': serializers.PrimaryKeyRelatedField(
+            many=True,
+            read_only=True
+        ),
+        'ingredients': RecipeIngredientCompactSerializer(
+            many=True,
+            read_only=True,
+            source='recipe_ingredient'
+        ),
+    }
 
     class Meta:
         model = Recipe
@@ -212,36 +319,89 @@ class RecipeSerializer(serializers.ModelSerializer):
             'name',
             'image',
             'text',
-            'cooking_time'
+            'cooking_time',
+            'favorites_count',
+            'cart_count'
+        )
+        read_only_fields = (
+            'favorites_count',
+            'cart_count'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return render_recipes(self, [instance])[0]
+        prefetch_related_objects(
+            [instance],
+            *self.get_sparse_prefetches(fieldset)
         )
+        return super().to_representation(instance)
+
+    def get_sparse_prefetches(self, fieldset):
+        """Функция выбора подгружаемых связей для набора полей."""
+        lookups = []
+        if fieldset.expanded('author'):
+            lookups.append('author')
+        if 'tags' in fieldset:
+            lookups.append('tags')
+        if fieldset.expanded('ingredients'):
+            lookups.append(Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ))
+        elif 'ingredients' in fieldset:
+            lookups.append('recipe_ingredient')
+        return lookups
+
+    def render_fragment(self, instance):
+        """Функция получения общей для всех пользователей части ответа."""
+        data = dict(super().to_representation(instance))
+        for field in VIEWER_FIELDS:
+            del data[field]
+        data['author'] = dict(data['author'])
+        del data['author']['is_subscribed']
+        return data
+
+    def overlay(self, fragment, instance, subscribed_author_ids):
+        """Функция дополнения фрагмента данными пользователя."""
+        values = {
+            **fragment,
+            'author': {
+                **fragment['author'],
+                'is_subscribed': instance.author_id in subscribed_author_ids
+            },
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            'favorites_count': instance.favorites_count,
+            'cart_count': instance.cart_count,
+        }
+        return {field: values[field] for field in self.Meta.fields}
 
     def get_is_in_shopping_cart(self, obj):
         """Функция проверки на наличие рецепта в корзине."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
-        return user.is_authenticated and ShoppingCart.objects.filter(
-            user=user,
-            recipe=obj.id
-        ).exists()
+        with sql_source('RecipeSerializer.get_is_in_shopping_cart'):
+            return user.is_authenticated and ShoppingCart.objects.filter(
+                user=user,
+                recipe=obj.id
+            ).exists()
 
     def get_is_favorited(self, obj):
         """Функция проверки на наличие рецепта в избранном."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
-        return user.is_authenticated and Favorite.objects.filter(
-            user=user,
-            recipe=obj
-        ).exists()
-
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep["tags"] = TagSerializer(
-            instance.tags.all(),
-            many=True
-        ).data
-        rep["ingredients"] = RecipeIngredientSerializer(
-            instance.recipe_ingredient.all(),
-            many=True
-        ).data
-        return rep
+        with sql_source('RecipeSerializer.get_is_favorited'):
+            return user.is_authenticated and Favorite.objects.filter(
+                user=user,
+                recipe=obj
+            ).exists()
 
 
 class RecipeSubscribeSerializer(serializers.ModelSerializer):
@@ -258,7 +418,7 @@ class RecipeSubscribeSerializer(serializers.ModelSerializer):
         )
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор подписок."""
     id = serializers.ReadOnlyField(source='author.id')
     email = serializers.ReadOnlyField(source='author.email')
@@ -267,7 +427,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
+    compact_fields = {
+        'recipes': serializers.SerializerMethodField(
+            method_name='get_recipe_ids'
+        ),
+    }
 
     class Meta:
         model = Subscribe
@@ -283,21 +448,50 @@ class SubscribeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        """Функция проверки на наличия в подписках."""
-        return Subscribe.objects.filter(
-            user=obj.user,
-            author=obj.author
-        ).exists()
+        """Функция проверки на наличия в подписках.
+
+        Сериализатор получает только подписки текущего пользователя,
+        поэтому флаг всегда истинен.
+        """
+        return True
+
+    def get_author_recipes(self, obj):
+        """Функция получения рецептов автора с учётом recipes_limit."""
+        limit = self.context.get('recipes_limit')
+        if hasattr(obj.author, 'recipes_preview'):
+            return obj.author.recipes_preview
+        queryset = Recipe.objects.filter(author=obj.author)
+        if limit is None:
+            return queryset
+        return queryset[:limit]
 
+    @sql_source('SubscribeSerializer.get_recipes')
     def get_recipes(self, obj):
         """Функция получения рецептов."""
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return RecipeSubscribeSerializer(queryset, many=True).data
+        return RecipeSubscribeSerializer(
+            self.get_author_recipes(obj),
+            many=True
+        ).data
+
+    @sql_source('SubscribeSerializer.get_recipes')
+    def get_recipe_ids(self, obj):
+        """Функция получения id рецептов."""
+        return [recipe.id for recipe in self.get_author_recipes(obj)]
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    """Сериализатор проверки параметра recipes_limit."""
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для массовых операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT
+    )
 
-    def get_recipes_count(self, obj):
-        """Функция получения кол-ва рецептов."""
-        return Recipe.objects.filter(author=obj.author).count()
+    def validate_recipes(self, value):
+        """Функция удаления повторов с сохранением порядка."""
+        return list(dict.fromkeys(value))
@@ -0,0 +1,58 @@
+import csv
+import json
+
+SHOPPING_LIST_FOOTER = '@Продуктовый помощник Foodgram'
+
+
+class Echo:
+    """Псевдо-буфер, возвращающий записанную строку."""
+    def write(self, value):
+        return value
+
+
+def render_txt(user, ingredients):
+    """Построчная выдача списка покупок в текстовом виде."""
+    yield f'{user.get_full_name()}, вот ваш список покупок:\n\n'
+    for ingredient in ingredients:
+        yield (
+            f'* {ingredient["name"]} '
+            f'- {ingredient["amount"]} '
+            f'({ingredient["measurement_unit"]})\n'
+        )
+    yield f'\n\n{SHOPPING_LIST_FOOTER}'
+
+
+def render_csv(user, ingredients):
+    """Построчная выдача списка покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['amount']
+        ))
+
+
+def render_json(user, ingredients):
+    """Поэлементная выдача списка покупок в формате JSON."""
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ingredient['name'],
+                'measurement_unit': ingredient['measurement_unit'],
+                'amount': ingredient['amount']
+            },
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json; charset=utf-8'),
+}
@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .sql_comments import current_sql_source, normalize_sql
+
+
+def redact_params(params, many=False):
+    """Параметры запроса без значений: только их типы."""
+    if params is None:
+        return None
+    if many:
+        return f'<{len(params)} rows>'
+    if isinstance(params, dict):
+        return {
+            name: type(value).__name__ for name, value in params.items()
+        }
+    return [type(value).__name__ for value in params]
+
+
+class SlowLog:
+    """Журнал медленных запросов в формате JSON lines.
+
+    Записи ограничены долей SLOW_LOG_SAMPLE_RATE и корзиной токенов:
+    не более SLOW_LOG_RATE записей в секунду с запасом SLOW_LOG_BURST
+    на процесс. Число отброшенных записей сохраняется в следующей.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = None
+        self.updated_at = time.monotonic()
+        self.dropped = 0
+
+    def allow(self):
+        if random.random() >= settings.SLOW_LOG_SAMPLE_RATE:
+            return False
+        now = time.monotonic()
+        if self.tokens is None:
+            self.tokens = settings.SLOW_LOG_BURST
+        self.tokens = min(
+            settings.SLOW_LOG_BURST,
+            self.tokens + (now - self.updated_at) * settings.SLOW_LOG_RATE
+        )
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def write(self, entry):
+        with self.lock:
+            if not self.allow():
+                self.dropped += 1
+                return False
+            entry = {
+                'time': datetime.now(timezone.utc).isoformat(),
+                'pid': os.getpid(),
+                **entry,
+                'dropped': self.dropped,
+            }
+            self.dropped = 0
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        descriptor = os.open(
+            settings.SLOW_LOG_PATH,
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644
+        )
+        try:
+            os.write(descriptor, line.encode())
+        finally:
+            os.close(descriptor)
+        return True
+
+
+slow_log = SlowLog()
+
+
+class SlowQueryLogger:
+    """Обёртка execute_wrapper: счёт запросов и запись медленных."""
+
+    def __init__(self, request, endpoint_name):
+        self.request = request
+        self.endpoint_name = endpoint_name
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            if duration * 1000 >= settings.SLOW_QUERY_MS:
+                slow_log.write({
+                    'type': 'query',
+                    'endpoint': self.endpoint_name(self.request),
+                    'source': current_sql_source(),
+                    'statement': normalize_sql(sql),
+                    'params': redact_params(params, many),
+                    'milliseconds': round(duration * 1000, 3),
+                })
+
+
+def log_slow_request(request, response, endpoint, duration, queries):
+    """Запись медленного запроса к приложению."""
+    if duration * 1000 < settings.SLOW_REQUEST_MS:
+        return
+    match = getattr(request, 'resolver_match', None)
+    slow_log.write({
+        'type': 'request',
+        'endpoint': endpoint,
+        'method': request.method,
+        'path': request.path,
+        'params': {key: request.GET.getlist(key) for key in request.GET},
+        'kwargs': match.kwargs if match is not None else {},
+        'status': response.status_code,
+        'milliseconds': round(duration * 1000, 3),
+        'queries': queries,
+    })
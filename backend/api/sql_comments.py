@@ -0,0 +1,91 @@
+import hashlib
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.functional import LazyObject
+
+_source = ContextVar('sql_source', default=None)
+
+UNSAFE_CHARS = re.compile(r'[^\w.\-]')
+
+# Замены для приведения запроса к шаблону без значений.
+NORMALIZE_RULES = (
+    (re.compile(r'\s*/\*.*?\*/\s*$', re.S), ''),
+    (re.compile(r"'(?:[^']|'')*'"), '%s'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '%s'),
+    (re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+@contextmanager
+def sql_source(name):
+    """Пометка запросов блока кода или функции (как декоратор) именем."""
+    token = _source.set(name)
+    try:
+        yield
+    finally:
+        _source.reset(token)
+
+
+def current_sql_source():
+    """Имя участка кода, выполняющего запрос, если он помечен."""
+    return _source.get()
+
+
+def normalize_sql(sql):
+    """Шаблон запроса: без комментария, литералов и длины списков IN.
+
+    Запросы, отличающиеся только параметрами, дают одинаковый шаблон.
+    """
+    for pattern, replacement in NORMALIZE_RULES:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def user_bucket(request):
+    """Группа пользователя по хэшу id, без раскрытия самого id.
+
+    Пользователь берётся только после аутентификации DRF, ленивый
+    объект сессии не вычисляется, чтобы не делать запрос из обёртки.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or issubclass(type(user), LazyObject):
+        return '-'
+    if not user.is_authenticated:
+        return 'anon'
+    digest = hashlib.sha256(str(user.pk).encode()).hexdigest()
+    return str(int(digest, 16) % settings.SQL_COMMENT_USER_BUCKETS)
+
+
+class SqlCommenter:
+    """Обёртка execute_wrapper, дописывающая к запросу комментарий.
+
+    Комментарий содержит только имена маршрута, действия и источника
+    и группу пользователя, без параметров запроса, поэтому
+    pg_stat_statements группирует запросы как прежде. Имя действия
+    вычисляет переданная функция от запроса.
+    """
+
+    def __init__(self, request, endpoint_name):
+        self.request = request
+        self.endpoint_name = endpoint_name
+
+    def comment(self):
+        match = getattr(self.request, 'resolver_match', None)
+        tags = {
+            'action': self.endpoint_name(self.request),
+            'route': match.view_name if match is not None else '-',
+            'source': current_sql_source(),
+            'user': user_bucket(self.request),
+        }
+        return ' /*{}*/'.format(','.join(
+            "{}='{}'".format(name, UNSAFE_CHARS.sub('_', value))
+            for name, value in tags.items() if value
+        ))
+
+    def __call__(self, execute, sql, params, many, context):
+        return execute(sql + self.comment(), params, many, context)
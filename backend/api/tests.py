@@ -0,0 +1,177 @@
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, override_settings
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+
+from rest_framework.test import APIClient
+
+from users.models import Subscribe, User
+
+from .filters import RecipeFilter
+
+
+class RecipeFilterQueryTests(TestCase):
+    """Проверка SQL фильтров автора, избранного и корзины."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user',
+            email='user@example.com',
+            password='password',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        recipe = Recipe.objects.create(
+            author=cls.user,
+            name='Рецепт',
+            image='recipes/images/recipe.png',
+            text='Описание',
+            cooking_time=5
+        )
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def filtered(self, data):
+        request = RequestFactory().get('/api/recipes/', data)
+        request.user = self.user
+        return RecipeFilter(
+            data,
+            queryset=Recipe.objects.all(),
+            request=request
+        ).qs
+
+    def test_author_filter_compares_id_without_join(self):
+        queryset = self.filtered({'author': self.user.id})
+        sql = str(queryset.query)
+        self.assertIn('"recipes_recipe"."author_id" = ', sql)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertEqual(queryset.count(), 1)
+
+    def test_mark_filters_use_exists_without_join(self):
+        for data, count in (
+            ({'is_favorited': 'true'}, 1),
+            ({'is_in_shopping_cart': 'true'}, 1),
+            ({'is_favorited': 'false', 'is_in_shopping_cart': 'false'}, 0),
+        ):
+            with self.subTest(data=data):
+                queryset = self.filtered({'author': self.user.id, **data})
+                sql = str(queryset.query)
+                self.assertIn('EXISTS', sql)
+                self.assertNotIn('JOIN', sql)
+                self.assertNotIn('DISTINCT', sql)
+                self.assertEqual(queryset.count(), count)
+
+    def test_combined_filters_have_no_join_or_distinct(self):
+        sql = str(self.filtered({
+            'author': self.user.id,
+            'is_favorited': 'true',
+            'is_in_shopping_cart': 'false',
+        }).query)
+        self.assertEqual(sql.count('EXISTS'), 2)
+        self.assertIn('NOT EXISTS', sql)
+        self.assertIn('"recipes_recipe"."author_id" = ', sql)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_author_filter_rejects_non_integer(self):
+        client = APIClient()
+        for value in ('1.5', 'abc'):
+            with self.subTest(value=value):
+                response = client.get('/api/recipes/', {'author': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('author', response.json())
+
+
+class FastReadParityTests(TestCase):
+    """Совпадение ответов чтения без сериализатора с RecipeSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, other = (
+            User.objects.create_user(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                password='password',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}'
+            )
+            for number in range(3)
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        recipes = []
+        for number, author in enumerate((cls.author, other, cls.author)):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                image=f'recipes/images/recipe{number}.png',
+                text=f'Описание {number}',
+                cooking_time=number + 1
+            )
+            recipe.tags.set(tags[:number + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=10 * (number + 1)
+                )
+                for ingredient in ingredients[number:]
+            )
+            recipes.append(recipe)
+        Favorite.objects.create(user=cls.reader, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.reader, recipe=recipes[1])
+        Subscribe.objects.create(user=cls.reader, author=cls.author)
+        cls.recipe = recipes[0]
+
+    def get(self, url, user, fast_read):
+        for name in ('default', 'fragments'):
+            caches[name].clear()
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with override_settings(RECIPE_FAST_READ=fast_read):
+            response = client.get(url)
+        return response.status_code, response.json()
+
+    def test_list_and_detail_match_serializer(self):
+        for url in (
+            '/api/recipes/',
+            '/api/recipes/?is_favorited=1',
+            f'/api/recipes/{self.recipe.id}/',
+            f'/api/recipes/{self.recipe.id}/?is_favorited=0',
+            '/api/recipes/0/',
+        ):
+            for user in (None, self.reader):
+                with self.subTest(url=url, user=user):
+                    self.assertEqual(
+                        self.get(url, user, fast_read=True),
+                        self.get(url, user, fast_read=False)
+                    )
+
+    @override_settings(RECIPE_FAST_READ=True)
+    def test_validation_errors_render_with_fast_read(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        response = client.post(
+            '/api/recipes/shopping_cart/',
+            {'recipes': ['x', 1]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('0', response.json()['recipes'])
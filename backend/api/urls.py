@@ -19,6 +19,7 @@ router.register(r'^recipes/(?P<recipe_id>\d+)/shopping_cart',
                 views.ShoppingCartViewSet, basename='shopping_cart')
 
 urlpatterns = [
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,30 +1,46 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from djoser.views import UserViewSet
 
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.models import (USER_FLAGS, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.services import add_recipes_in_bulk, remove_recipes_in_bulk
 
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from users.models import Subscribe, User
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import FavoriteViewSet
+from .coalescing import single_flight
+from .fieldsets import parse_fieldset
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .ingredient_index import get_ingredient_index
+from .loaders import reset_subscribed_author_ids
+from .metrics import load_metrics, registry, render_prometheus
+from .mixins import (AnonymousListCacheMixin, CatalogueSnapshotMixin,
+                     FastRecipeReadMixin, FavoriteViewSet)
 from .pagination import CustomPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
-                          RecipeSerializer, RecipeSubscribeSerializer,
-                          SubscribeSerializer, TagSerializer)
+                          RecipeIdsSerializer, RecipeSerializer,
+                          RecipesLimitSerializer, RecipeSubscribeSerializer,
+                          ShoppingListItemSerializer, SubscribeSerializer,
+                          TagSerializer)
+from .shopping_list import SHOPPING_LIST_FORMATS
 
 
 class UserViewSet(UserViewSet):
     """Класс viewset пользователя."""
+    cursor_pagination_actions = ('subscriptions',)
+
     @action(
         detail=True,
         permission_classes=[permissions.IsAuthenticated],
@@ -33,38 +49,52 @@ class UserViewSet(UserViewSet):
     def subscribe(self, request, id=None):
         """Функция обработки подписок с валидациями."""
         user = request.user
-        author = get_object_or_404(User, id=id)
 
         if self.request.method == 'POST':
+            author = get_object_or_404(User, id=id)
             if user == author:
                 return Response(
                     {'errors': 'Нельзя подписаться на самого себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if Subscribe.objects.filter(user=user, author=author).exists():
+            recipes_limit = self.get_recipes_limit()
+            try:
+                with transaction.atomic():
+                    follow = Subscribe.objects.create(
+                        user=user,
+                        author=author
+                    )
+            except IntegrityError:
                 return Response(
                     {'errors': 'Вы уже подписаны на данного пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            follow = Subscribe.objects.create(user=user, author=author)
+            reset_subscribed_author_ids(request)
             serializer = SubscribeSerializer(
                 follow,
-                context={'request': request}
+                context={
+                    'request': request,
+                    'recipes_limit': recipes_limit
+                }
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if user == author:
+        if str(user.id) == str(id):
             return Response(
                 {'errors': 'Нельзя отписаться от самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if Subscribe.objects.filter(user=user, author=author).exists():
-            follow = get_object_or_404(Subscribe, user=user, author=author)
-            follow.delete()
+        deleted, _ = Subscribe.objects.filter(
+            user=user,
+            author_id=id
+        ).delete()
+        if deleted:
+            reset_subscribed_author_ids(request)
             return Response(
                 'Подписка успешно удалена',
                 status=status.HTTP_204_NO_CONTENT
             )
+        get_object_or_404(User, id=id)
         return Response(
             {'errors': 'Вы не подписаны на данного пользователя'},
             status=status.HTTP_400_BAD_REQUEST
@@ -77,27 +107,60 @@ class UserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         """Функция получения подписок пользователя."""
-        user = request.user
-        queryset = Subscribe.objects.filter(user=user)
+        limit = self.get_recipes_limit()
+        fieldset = parse_fieldset(request, SubscribeSerializer)
+        queryset = Subscribe.objects.filter(
+            user=request.user
+        ).select_related('author').order_by('-id')
+        if fieldset is None or 'recipes' in fieldset:
+            recipes = Recipe.objects.all()
+            if fieldset is not None and not fieldset.expanded('recipes'):
+                recipes = recipes.only('id', 'author')
+            if limit is not None:
+                recipes = recipes.filter(pk__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef('author')
+                    ).values('pk')[:limit]
+                ))
+            queryset = queryset.prefetch_related(Prefetch(
+                'author__recipe',
+                queryset=recipes,
+                to_attr='recipes_preview'
+            ))
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context={
+                'request': request,
+                'recipes_limit': limit,
+                'fieldset': fieldset
+            }
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self):
+        """Функция проверки параметра recipes_limit."""
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CatalogueSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     """Класс viewset тегов."""
+    catalogue_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    CatalogueSnapshotMixin,
+    viewsets.ReadOnlyModelViewSet
+):
     """Класс viewset ингредиентов."""
+    catalogue_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [permissions.AllowAny]
@@ -105,6 +168,16 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """Функция поиска ингредиентов по индексу в памяти."""
+        name = request.query_params.get('name')
+        if name is None or not settings.INGREDIENT_SEARCH_INDEX:
+            return super().list(request, *args, **kwargs)
+        return Response(get_ingredient_index().search(
+            name,
+            request.query_params.get('measurement_unit')
+        ))
+
 
 class FavoriteViewSet(FavoriteViewSet):
     """Класс viewset избранного."""
@@ -115,12 +188,14 @@ class FavoriteViewSet(FavoriteViewSet):
     def create(self, request, recipe_id):
         """Функция добавления рецепта в избранное с валидациями."""
         recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if Favorite.objects.filter(user=request.user, recipe=recipe).exists():
+        try:
+            with transaction.atomic():
+                Favorite.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             return Response(
                 data={'detail': 'Рецепт уже добавлен в избранное!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Favorite.objects.create(user=request.user, recipe=recipe)
         serializer = self.get_serializer(recipe)
         return Response(
             serializer.data,
@@ -129,16 +204,17 @@ class FavoriteViewSet(FavoriteViewSet):
 
     def delete(self, request, recipe_id):
         """Функция удаления рецепта из избранного с валидациями."""
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if not Favorite.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                data={'detail': 'Рецепт ещё не добавлен в избранное!'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite = Favorite.objects.filter(user=user, recipe=recipe)
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        deleted, _ = Favorite.objects.filter(
+            user=request.user,
+            recipe_id=recipe_id
+        ).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response(
+            data={'detail': 'Рецепт ещё не добавлен в избранное!'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
 
 class ShoppingCartViewSet(viewsets.ModelViewSet):
@@ -150,39 +226,80 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
     def create(self, request, recipe_id):
         """Функция добавления рецепта в корзину с валидациями."""
         recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=recipe
-        ).exists():
+        try:
+            with transaction.atomic():
+                ShoppingCart.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             return Response(
                 data={'detail': 'Вы уже добавили этот рецепт!'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
         """Функция удаления рецепта из избранного с валидациями."""
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=recipe_id)
-        if not ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                data={'detail': 'Вы ещё не добавили этот рецепт!'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        cart = ShoppingCart.objects.filter(user=user, recipe=recipe)
-        cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        deleted, _ = ShoppingCart.objects.filter(
+            user=request.user,
+            recipe_id=recipe_id
+        ).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response(
+            data={'detail': 'Вы ещё не добавили этот рецепт!'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AnonymousListCacheMixin,
+    FastRecipeReadMixin,
+    viewsets.ModelViewSet
+):
     """Класс viewset рецептов."""
+    list_cache_name = 'recipe-list'
     queryset = Recipe.objects.all()
     pagination_class = CustomPagination
     permission_classes = [IsAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, RecipeOrderingFilter]
     filterset_class = RecipeFilter
+    ordering_fields = ('id', 'favorites_count', 'cart_count')
+    ordering = ('-id',)
+    cursor_pagination_actions = ('list',)
+
+    def get_fieldset(self):
+        """Функция получения набора полей из параметров fields и expand."""
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = None
+            if self.action in ['list', 'retrieve']:
+                self._fieldset = parse_fieldset(self.request, RecipeSerializer)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def get_queryset(self):
+        """Функция выборки рецептов с флагами и связанными объектами."""
+        queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+        # Связанные объекты подгружает RecipeSerializer только
+        # для рецептов, которых нет в кэше фрагментов.
+        fieldset = self.get_fieldset()
+        flags = USER_FLAGS if fieldset is None else [
+            flag for flag in USER_FLAGS if flag in fieldset
+        ]
+        return queryset.defer('search_vector').with_user_flags(
+            self.request.user,
+            flags
+        )
+
+    @single_flight('get_list_flight_key', stale='get_stale_list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def get_serializer_class(self):
         """Функция выбора сериализатора по выполняемому запросу."""
@@ -190,30 +307,134 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    @transaction.atomic
+    def bulk_toggle(self, request, model):
+        """Функция массового добавления и удаления рецептов.
+
+        Возвращает результат для каждого переданного id: added,
+        already_added, removed, not_added или not_found.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        marked = dict(
+            Recipe.objects.filter(pk__in=recipe_ids).annotate(
+                marked=Exists(model.objects.filter(
+                    user=request.user,
+                    recipe=OuterRef('pk')
+                ))
+            ).values_list('pk', 'marked')
+        )
+        if request.method == 'POST':
+            changed = [pk for pk in recipe_ids if marked.get(pk) is False]
+            if changed:
+                changed = add_recipes_in_bulk(
+                    model,
+                    request.user.id,
+                    changed
+                )
+            outcomes = ('added', 'already_added')
+        else:
+            changed = [pk for pk in recipe_ids if marked.get(pk)]
+            if changed:
+                changed = remove_recipes_in_bulk(
+                    model,
+                    request.user.id,
+                    changed
+                )
+            outcomes = ('removed', 'not_added')
+        changed = set(changed)
+        return Response({'recipes': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in marked
+                    else outcomes[0] if pk in changed
+                    else outcomes[1]
+                )
+            }
+            for pk in recipe_ids
+        ]})
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        methods=['POST', 'DELETE'],
+        url_path='favorite'
+    )
+    def bulk_favorite(self, request):
+        """Функция массового добавления и удаления избранного."""
+        return self.bulk_toggle(request, Favorite)
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart'
+    )
+    def bulk_shopping_cart(self, request):
+        """Функция массового добавления и удаления рецептов корзины."""
+        return self.bulk_toggle(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='shopping_cart_summary'
+    )
+    def shopping_cart_summary(self, request):
+        """Функция получения сводки по корзине пользователя."""
+        return Response({
+            'recipes_count': ShoppingCart.objects.filter(
+                user=request.user
+            ).count(),
+            'ingredients': ShoppingListItemSerializer(
+                ShoppingListItem.objects.filter(
+                    user=request.user
+                ).with_ingredient_values(),
+                many=True
+            ).data
+        })
+
     @action(
         detail=False,
         permission_classes=[permissions.IsAuthenticated],
         url_path='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        """Функция создания и скачивания файла корзины пользователя."""
-        ingredients = ShoppingCart.objects.filter(user=request.user).values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(amount=Sum('recipe__recipe_ingredient__amount'))
-        user = request.user.get_full_name()
-        shopping_cart = f'{user}, вот ваш список покупок:\n\n'
-        for ingredient in ingredients:
-            shopping_cart += (
-                f'* {ingredient["recipe__ingredients__name"]} '
-                f'- {ingredient["amount"]} '
-                f'({ingredient["recipe__ingredients__measurement_unit"]})\n'
+        """Функция создания и скачивания файла корзины пользователя.
+
+        Формат файла задаётся параметром file_format: txt, csv или json.
+        """
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Неизвестный формат файла'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        shopping_cart += '\n\n@Продуктовый помощник Foodgram'
-        filename = f'{user}_shopping_list.txt'
-        response = HttpResponse(
-            shopping_cart,
-            content_type='text.txt; charset=utf-8'
+        render, content_type = SHOPPING_LIST_FORMATS[file_format]
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).with_ingredient_values().iterator()
+        response = StreamingHttpResponse(
+            render(request.user, ingredients),
+            content_type=content_type
+        )
+        filename = f'{request.user.get_full_name()}_shopping_list'
+        response['Content-Disposition'] = (
+            f'attachment; filename={filename}.{file_format}'
         )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
+
+
+class MetricsView(APIView):
+    """Метрики запросов всех воркеров в формате Prometheus."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Функция выдачи метрик с записью данных текущего процесса."""
+        if settings.METRICS_ENABLED:
+            registry.flush()
+        return HttpResponse(
+            render_prometheus(*load_metrics()),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
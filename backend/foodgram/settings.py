@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -30,6 +31,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.SlowLogMiddleware',
+    'api.middleware.SqlCommentMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +80,31 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    'fragments': {
+        'BACKEND': os.getenv(
+            'FRAGMENT_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv(
+            'FRAGMENT_CACHE_LOCATION',
+            default='foodgram-fragments'
+        ),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Псевдоним кэша фрагментов рецептов, пустая строка отключает кэш.
+RECIPE_FRAGMENT_CACHE = os.getenv('RECIPE_FRAGMENT_CACHE', default='fragments')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': ('django.contrib.auth.password_validation'
@@ -127,6 +157,66 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+PAGINATION_MODE = os.getenv('PAGINATION_MODE', default='page')
+
+BULK_RECIPES_LIMIT = 100
+
+# Чтение рецептов через values() без сериализатора DRF.
+RECIPE_FAST_READ = os.getenv('RECIPE_FAST_READ', default='') == 'True'
+
+# Метрики запросов для /api/metrics/, файлы воркеров хранятся в METRICS_DIR.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='') == 'True'
+METRICS_DIR = os.getenv(
+    'METRICS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+
+# Журнал медленных запросов в формате JSON lines.
+SLOW_LOG_ENABLED = os.getenv('SLOW_LOG_ENABLED', default='') == 'True'
+SLOW_LOG_PATH = os.getenv(
+    'SLOW_LOG_PATH',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-slow.jsonl')
+)
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', default=500))
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', default=100))
+SLOW_LOG_SAMPLE_RATE = float(os.getenv('SLOW_LOG_SAMPLE_RATE', default=1))
+SLOW_LOG_RATE = 5
+SLOW_LOG_BURST = 50
+
+# Комментарии к SQL запросам с маршрутом, действием и группой пользователя.
+SQL_COMMENTS_ENABLED = os.getenv('SQL_COMMENTS_ENABLED', default='') == 'True'
+SQL_COMMENT_USER_BUCKETS = 16
+
+# Профилирование запросов к API персоналом по параметру ?profile.
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', default='') == 'True'
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_EXPLAIN_LIMIT = 50
+PROFILE_DUPLICATE_THRESHOLD = 2
+
+# Блокировка пересчёта промахов кэша: cache (общий кэш) или file (flock).
+SINGLE_FLIGHT_LOCK = os.getenv('SINGLE_FLIGHT_LOCK', default='cache')
+SINGLE_FLIGHT_LOCK_DIR = os.getenv(
+    'SINGLE_FLIGHT_LOCK_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-locks')
+)
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_POLL = 0.05
+
+# Сколько секунд процесс использует прочитанную из базы версию
+# справочника, 0 - читать при каждом обращении.
+CATALOGUE_VERSION_TTL = float(os.getenv('CATALOGUE_VERSION_TTL', default=1))
+
+# Время жизни кэша списка рецептов для анонимных пользователей, 0 - без кэша.
+ANONYMOUS_LIST_CACHE_TIMEOUT = int(
+    os.getenv('ANONYMOUS_LIST_CACHE_TIMEOUT', default=60)
+)
+
+INGREDIENT_SEARCH_INDEX = True
+INGREDIENT_INDEX_USAGE_RANKING = True
+INGREDIENT_INDEX_TTL = 60 * 60
+
 DJOSER = {
     'HIDE_USERS': False,
     'PERMISSIONS': {
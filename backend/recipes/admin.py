@@ -4,6 +4,9 @@ from foodgram.settings import EMPTY_VALUE
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .search import update_search_vectors
+from .services import (bump_recipe_versions, rebuild_shopping_lists,
+                       rebuild_shopping_lists_for_recipe)
 
 admin.site.site_header = 'Администрирование Foodgram'
 
@@ -34,6 +37,13 @@ class IngredientAdmin(admin.ModelAdmin):
     inlines = [RecipeIngredientsInline]
     empty_value_display = EMPTY_VALUE
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        rebuild_shopping_lists(ingredient_ids=[form.instance.id])
+        recipe_ids = form.instance.recipe_ingredient.values('recipe_id')
+        update_search_vectors(recipe_ids)
+        bump_recipe_versions(recipe_ids)
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -87,7 +97,13 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='Всего в избранном')
     def in_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        rebuild_shopping_lists_for_recipe(form.instance)
+        update_search_vectors([form.instance.id])
+        bump_recipe_versions([form.instance.id])
 
 
 @admin.register(RecipeIngredient)
@@ -110,6 +126,34 @@ class RecipeIngredientsAdmin(admin.ModelAdmin):
     ordering = ['id']
     empty_value_display = EMPTY_VALUE
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        ingredient_ids = {obj.ingredient_id}
+        if form.initial.get('ingredient'):
+            ingredient_ids.add(form.initial['ingredient'])
+        rebuild_shopping_lists(ingredient_ids=ingredient_ids)
+        recipe_ids = {obj.recipe_id}
+        if form.initial.get('recipe'):
+            recipe_ids.add(form.initial['recipe'])
+        update_search_vectors(recipe_ids)
+        bump_recipe_versions(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_shopping_lists(ingredient_ids=[obj.ingredient_id])
+        update_search_vectors([obj.recipe_id])
+        bump_recipe_versions([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        ingredient_ids = set(
+            queryset.values_list('ingredient_id', flat=True)
+        )
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_shopping_lists(ingredient_ids=ingredient_ids)
+        update_search_vectors(recipe_ids)
+        bump_recipe_versions(recipe_ids)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
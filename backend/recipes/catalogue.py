@@ -0,0 +1,75 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+# Прочитанные версии процесса: название -> (версия, время чтения).
+_versions = {}
+
+# Соответствие slug тега его id и версия справочника тегов.
+_tag_ids = {'ids': None, 'version': None}
+_tag_ids_lock = threading.Lock()
+
+
+def get_catalogue_version(name):
+    """Текущая версия справочника (ингредиенты, теги) или кэша.
+
+    Версия хранится в базе, поэтому изменение в любом процессе, в том
+    числе в служебной команде, видно остальным. Прочитанная версия
+    используется процессом не дольше CATALOGUE_VERSION_TTL секунд.
+    """
+    from .models import CatalogueVersion
+
+    cached = _versions.get(name)
+    if cached is not None and (
+        time.monotonic() - cached[1] < settings.CATALOGUE_VERSION_TTL
+    ):
+        return cached[0]
+    version = CatalogueVersion.objects.filter(
+        name=name
+    ).values_list('version', flat=True).first()
+    _versions[name] = (f'{version or 0:x}', time.monotonic())
+    return _versions[name][0]
+
+
+def bump_catalogue_version(name):
+    """Смена версии справочника после его изменения.
+
+    Выполняется после фиксации транзакции, иначе параллельный запрос
+    может закэшировать старые данные уже под новой версией.
+    """
+    from .models import CatalogueVersion
+
+    def bump():
+        version = time.time_ns()
+        if not CatalogueVersion.objects.filter(name=name).update(
+            version=version
+        ):
+            CatalogueVersion.objects.get_or_create(
+                name=name,
+                defaults={'version': version}
+            )
+        _versions.pop(name, None)
+
+    transaction.on_commit(bump)
+
+
+def get_tag_ids():
+    """Соответствие slug тега его id.
+
+    Хранится в памяти процесса и перечитывается из базы
+    только при смене версии справочника тегов.
+    """
+    from .models import Tag
+
+    version = get_catalogue_version('tags')
+    if _tag_ids['ids'] is not None and _tag_ids['version'] == version:
+        return _tag_ids['ids']
+    with _tag_ids_lock:
+        if _tag_ids['ids'] is None or _tag_ids['version'] != version:
+            _tag_ids.update(
+                ids=dict(Tag.objects.values_list('slug', 'id')),
+                version=version
+            )
+        return _tag_ids['ids']
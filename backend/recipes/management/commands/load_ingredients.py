@@ -1,35 +1,236 @@
 import csv
+import io
+import json
+import time
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from foodgram.settings import BASE_DIR
 
+from recipes.catalogue import bump_catalogue_version
 from recipes.models import Ingredient
 
 DATA_FILE_PATH = Path(Path(BASE_DIR, 'data/'), 'ingredients.csv')
+FIELDS = ('name', 'measurement_unit')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Построчное чтение ингредиентов из csv."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def json_item(item, number):
+    """Проверка элемента JSON массива ингредиентов."""
+    if not isinstance(item, dict) or not all(
+        isinstance(item.get(field), str) for field in FIELDS
+    ):
+        raise CommandError(
+            f'Элемент {number}: ожидается объект со строковыми полями '
+            + ', '.join(FIELDS) + '.'
+        )
+    return item['name'], item['measurement_unit']
+
+
+def read_json(file):
+    """Поэлементное чтение ингредиентов из JSON массива объектов."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    number = 0
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            number += 1
+            yield json_item(item, number)
+        if not chunk:
+            if not started:
+                raise CommandError('Ожидается JSON массив ингредиентов.')
+            if buffer[position:].strip():
+                raise CommandError(
+                    f'Некорректный JSON после элемента {number}.'
+                )
+            raise CommandError('JSON массив ингредиентов не завершён.')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class RowsStream(io.TextIOBase):
+    """Файлоподобная обёртка над строками для COPY."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            writer.writerow(row)
+            self.buffer += output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
 
 class Command(BaseCommand):
-    """Служебная команда загрузки данных из csv."""
-    help = 'Загрузка данных ингредиентов из csv'
+    """Служебная команда загрузки ингредиентов из csv или json.
 
-    def handle(self, *args, **options):
+    Загрузка идемпотентна: добавляются только пары (название, единица
+    измерения), которых ещё нет в базе.
+    """
+    help = 'Загрузка данных ингредиентов из csv или json'
 
-        headerList = ['name', 'measurement_unit']
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DATA_FILE_PATH,
+            type=Path,
+            help='Путь к файлу с ингредиентами'
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Размер пакета для bulk_create'
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузка через COPY (только PostgreSQL)'
+        )
 
-        if Ingredient.objects.exists():
-            self.stderr.write('Данные уже загружены... Завершение.')
-            return
+    def rows(self, path, file_format):
+        """Очищенные строки файла без повторов внутри файла."""
+        seen = set()
+        with open(path, encoding='utf-8') as file:
+            for name, measurement_unit in READERS[file_format](file):
+                row = (name.strip(), measurement_unit.strip())
+                if row[0] and row not in seen:
+                    seen.add(row)
+                    yield row
 
-        self.stdout.write('Загрузка данных')
-        file = csv.DictReader(
-            open(DATA_FILE_PATH, encoding='utf-8'),
-            fieldnames=headerList
+    def insert_missing(self, batch):
+        """Вставка строк пакета, которых ещё нет в базе."""
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list(*FIELDS))
+        missing = [row for row in batch if row not in existing]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in missing
         )
-        for row in file:
-            data = Ingredient(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
+        return len(missing)
+
+    def load_bulk(self, rows, batch_size):
+        """Пакетная вставка отсутствующих ингредиентов.
+
+        Наличие в базе проверяется для каждого пакета отдельно, поэтому
+        память не зависит от размера справочника.
+        """
+        created = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                created += self.insert_missing(batch)
+                batch = []
+        if batch:
+            created += self.insert_missing(batch)
+        return created
+
+    def load_copy(self, rows):
+        """Загрузка через COPY во временную таблицу и INSERT ... SELECT."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('Загрузка через COPY доступна только в '
+                               'PostgreSQL.')
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
             )
-            data.save()
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                RowsStream(rows)
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT i.name, i.measurement_unit '
+                'FROM ingredient_import i WHERE NOT EXISTS ('
+                f'SELECT 1 FROM {table} r WHERE r.name = i.name '
+                'AND r.measurement_unit = i.measurement_unit)'
+            )
+            return cursor.rowcount
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}.')
+        self.stdout.write(f'Загрузка данных из {path}')
+        read = 0
+
+        def counted(rows):
+            nonlocal read
+            for row in rows:
+                read += 1
+                yield row
+
+        started = time.monotonic()
+        rows = counted(self.rows(path, file_format))
+        with transaction.atomic():
+            if options['copy']:
+                created = self.load_copy(rows)
+            else:
+                created = self.load_bulk(rows, options['batch_size'])
+        elapsed = max(time.monotonic() - started, 1e-6)
+        if created:
+            bump_catalogue_version('ingredients')
+        self.stdout.write(
+            f'Прочитано строк: {read}, добавлено: {created}, '
+            f'{read / elapsed:.0f} строк/с'
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from recipes.services import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    """Служебная команда пересчёта списков покупок."""
+    help = 'Пересчёт итоговых списков покупок из корзин пользователей'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Пересчёт списков покупок')
+        with transaction.atomic():
+            rebuild_shopping_lists()
+        self.stdout.write(
+            f'Готово, позиций: {ShoppingListItem.objects.count()}'
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.services import recount_counters
+
+
+class Command(BaseCommand):
+    """Служебная команда проверки денормализованных счётчиков."""
+    help = 'Проверка и исправление счётчиков избранного, корзин и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = recount_counters(fix=not options['check'])
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: расхождений {count}')
+        if options['check'] and any(drift.values()):
+            self.stderr.write('Найдены расхождения счётчиков.')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import full_text_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    """Служебная команда пересчёта поисковых векторов рецептов."""
+    help = 'Пересчёт поисковых векторов всех рецептов'
+
+    def handle(self, *args, **options):
+        if not full_text_supported():
+            self.stdout.write(
+                'Полнотекстовый поиск доступен только в PostgreSQL'
+            )
+            return
+        update_search_vectors()
+        self.stdout.write('Поисковые векторы обновлены')
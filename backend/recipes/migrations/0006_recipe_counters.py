@@ -0,0 +1,55 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:31
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def _actual_count(counted_model, relation):
+    return Coalesce(
+        models.Subquery(
+            counted_model.objects.filter(
+                **{relation: models.OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                total=models.Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('users', 'User')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Recipe.objects.update(
+        favorites_count=_actual_count(Favorite, 'recipe'),
+        cart_count=_actual_count(ShoppingCart, 'recipe')
+    )
+    User.objects.update(
+        recipes_count=_actual_count(Recipe, 'author'),
+        subscribers_count=_actual_count(Subscribe, 'author')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistitem'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Всего в корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Всего в избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
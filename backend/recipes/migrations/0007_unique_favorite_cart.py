@@ -0,0 +1,70 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+def remove_duplicates(model, counter):
+    """Удаление повторных строк (user, recipe) с пересчётом счётчика."""
+    Recipe = model._meta.get_field('recipe').related_model
+    duplicates = model.objects.values('user', 'recipe').annotate(
+        first_id=models.Min('id'),
+        total=models.Count('id')
+    ).filter(total__gt=1)
+    user_ids = set()
+    for duplicate in duplicates:
+        model.objects.filter(
+            user=duplicate['user'],
+            recipe=duplicate['recipe']
+        ).exclude(id=duplicate['first_id']).delete()
+        Recipe.objects.filter(id=duplicate['recipe']).update(**{
+            counter: model.objects.filter(recipe=duplicate['recipe']).count()
+        })
+        user_ids.add(duplicate['user'])
+    return user_ids
+
+
+def remove_duplicate_favorites_and_carts(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    remove_duplicates(Favorite, 'favorites_count')
+    user_ids = remove_duplicates(ShoppingCart, 'cart_count')
+    if not user_ids:
+        return
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__cart__user_id__in=user_ids
+    ).values('recipe__cart__user', 'ingredient').annotate(
+        total=models.Sum('amount')
+    ).values_list('recipe__cart__user', 'ingredient', 'total').order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            amount=total
+        )
+        for user_id, ingredient_id, total in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_favorites_and_carts,
+            migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
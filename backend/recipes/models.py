@@ -1,7 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
-from users.models import User
+from users.models import DenormalizedFieldsMixin, User
 
 
 class Ingredient(models.Model):
@@ -57,7 +59,47 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+# Флаги рецепта, зависящие от пользователя.
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов."""
+
+    def with_related(self):
+        """Подгрузка автора, тегов и ингредиентов фиксированным числом
+        запросов. Поисковый вектор в ответах не нужен и не читается."""
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def with_user_flags(self, user, flags=USER_FLAGS):
+        """Аннотация флагов избранного и корзины для пользователя."""
+        if not user.is_authenticated:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(**{flag: false for flag in flags})
+        flag_models = {
+            'is_favorited': Favorite,
+            'is_in_shopping_cart': ShoppingCart,
+        }
+        return self.annotate(**{
+            flag: models.Exists(flag_models[flag].objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk')
+            ))
+            for flag in flags
+        })
+
+
+class Recipe(DenormalizedFieldsMixin, models.Model):
     """Класс модели рецептов."""
     author = models.ForeignKey(
         User,
@@ -96,11 +138,46 @@ class Recipe(models.Model):
         related_name='recipe',
         verbose_name='Теги'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Всего в избранном',
+        default=0,
+        db_index=True
+    )
+    cart_count = models.PositiveIntegerField(
+        verbose_name='Всего в корзинах',
+        default=0,
+        db_index=True
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    denormalized_fields = (
+        'favorites_count',
+        'cart_count',
+        'version',
+        'search_vector'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_gin'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -157,6 +234,12 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в избранное'
@@ -180,6 +263,88 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в корзину'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Набор запросов итогового списка покупок."""
+
+    def with_ingredient_values(self):
+        """Строки списка покупок с названием и единицей измерения."""
+        return self.values(
+            'ingredient',
+            'amount',
+            name=models.F('ingredient__name'),
+            measurement_unit=models.F('ingredient__measurement_unit')
+        ).order_by('name')
+
+
+class ShoppingListItem(models.Model):
+    """Класс модели итогового списка покупок пользователя.
+
+    Хранит суммарное кол-во каждого ингредиента по всем рецептам
+    в корзине и поддерживается при изменении корзины или рецептов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Кол-во'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class CatalogueVersion(models.Model):
+    """Класс модели версий справочников и кэшей (recipes.catalogue).
+
+    Версии хранятся в базе, поэтому их смена видна всем процессам:
+    воркерам gunicorn и служебным командам.
+    """
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=50,
+        unique=True
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
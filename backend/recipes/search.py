@@ -0,0 +1,66 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, models
+
+from .models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+
+
+def full_text_supported():
+    """Полнотекстовый поиск доступен только в PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def search_document():
+    """Поисковый вектор рецепта: название, ингредиенты и описание."""
+    ingredient_names = models.Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names'),
+        output_field=models.TextField()
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids=None):
+    """Обновление поисковых векторов переданных или всех рецептов."""
+    if not full_text_supported():
+        return
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(search_vector=search_document())
+
+
+def search_recipes(queryset, text):
+    """Поиск рецептов по тексту запроса.
+
+    В PostgreSQL используется поисковый вектор с GIN-индексом
+    и ранжированием (аннотация search_rank), в остальных базах -
+    поиск подстроки без ранжирования.
+    """
+    if full_text_supported():
+        query = SearchQuery(
+            text,
+            config=SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(models.F('search_vector'), query)
+        )
+    return queryset.filter(
+        models.Q(name__icontains=text)
+        | models.Q(text__icontains=text)
+        | models.Exists(RecipeIngredient.objects.filter(
+            recipe=models.OuterRef('pk'),
+            ingredient__name__icontains=text
+        ))
+    )
@@ -0,0 +1,266 @@
+import time
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribe, User
+
+from .catalogue import bump_catalogue_version
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem)
+
+BATCH_SIZE = 1000
+
+# Счётчик: (модель, поле счётчика, считаемая модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+# Счётчик рецепта для каждой модели с отметками пользователей.
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+
+
+def _recipe_totals(recipe_ids):
+    """Суммарное кол-во каждого ингредиента в переданных рецептах."""
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient').annotate(
+            total=models.Sum('amount')
+        ).values_list('ingredient', 'total')
+    )
+
+
+def _amount_delta(totals):
+    """Выражение изменения кол-ва для каждого ингредиента."""
+    return models.Case(
+        *(
+            models.When(ingredient_id=ingredient_id, then=total)
+            for ingredient_id, total in totals.items()
+        ),
+        default=0,
+        output_field=models.IntegerField()
+    )
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    """Добавление ингредиентов рецептов в список покупок пользователя.
+
+    Недостающие строки вставляются с нулевым кол-вом без ошибки при
+    конфликте, затем кол-во увеличивается через F(), поэтому
+    параллельные добавления не конфликтуют по уникальному индексу.
+    """
+    totals = _recipe_totals(recipe_ids)
+    if not totals:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                amount=0
+            )
+            for ingredient_id in totals
+        ),
+        ignore_conflicts=True
+    )
+    ShoppingListItem.objects.filter(
+        user_id=user_id,
+        ingredient_id__in=totals
+    ).update(amount=models.F('amount') + _amount_delta(totals))
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    """Вычитание ингредиентов рецептов из списка покупок пользователя."""
+    totals = _recipe_totals(recipe_ids)
+    if not totals:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id=user_id,
+        ingredient_id__in=totals
+    )
+    items.update(amount=Greatest(
+        models.F('amount') - _amount_delta(totals),
+        0
+    ))
+    items.filter(amount__lte=0).delete()
+
+
+def rebuild_shopping_lists(user_ids=None, ingredient_ids=None):
+    """Пересчёт списков покупок из корзин с нуля.
+
+    Без аргументов пересчитываются списки всех пользователей,
+    иначе только переданные пользователи и/или ингредиенты.
+    """
+    items = ShoppingListItem.objects.all()
+    lookups = {'recipe__cart__isnull': False}
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        lookups['recipe__cart__user_id__in'] = user_ids
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+        lookups['ingredient_id__in'] = ingredient_ids
+    items.delete()
+    # Условия на корзину передаются одним вызовом filter(), чтобы
+    # values() переиспользовал то же соединение с корзинами.
+    totals = RecipeIngredient.objects.filter(**lookups).values(
+        'recipe__cart__user', 'ingredient'
+    ).annotate(
+        total=models.Sum('amount')
+    ).values_list('recipe__cart__user', 'ingredient', 'total').order_by()
+    batch = []
+    for user_id, ingredient_id, total in totals.iterator():
+        batch.append(ShoppingListItem(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            amount=total
+        ))
+        if len(batch) >= BATCH_SIZE:
+            ShoppingListItem.objects.bulk_create(batch)
+            batch = []
+    ShoppingListItem.objects.bulk_create(batch)
+
+
+def rebuild_shopping_lists_for_recipe(recipe, ingredient_ids=None):
+    """Пересчёт списков покупок пользователей, у которых рецепт
+    находится в корзине."""
+    user_ids = list(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+    )
+    if user_ids:
+        rebuild_shopping_lists(user_ids, ingredient_ids)
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарное изменение счётчика через F() без ухода ниже нуля."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(models.F(field) + delta, 0)}
+    )
+
+
+def _insert_marks(model, user_id, recipe_ids):
+    """Вставка отметок пользователя без сигналов.
+
+    Возвращает id рецептов, для которых строка действительно создана.
+    Если часть строк уже добавлена параллельным запросом, вставка
+    повторяется по одной строке, пропуская конфликты.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(
+                model(user_id=user_id, recipe_id=pk) for pk in recipe_ids
+            )
+        return list(recipe_ids)
+    except IntegrityError:
+        pass
+    inserted = []
+    for pk in recipe_ids:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [model(user_id=user_id, recipe_id=pk)]
+                )
+        except IntegrityError:
+            continue
+        inserted.append(pk)
+    return inserted
+
+
+@transaction.atomic
+def add_recipes_in_bulk(model, user_id, recipe_ids):
+    """Массовое добавление рецептов в избранное или корзину.
+
+    bulk_create не отправляет сигналы, поэтому счётчики и список
+    покупок обновляются здесь и только для созданных строк.
+    Возвращает id добавленных рецептов.
+    """
+    inserted = _insert_marks(model, user_id, recipe_ids)
+    if inserted:
+        change_counter(Recipe, inserted, RECIPE_COUNTERS[model], 1)
+        if model is ShoppingCart:
+            add_to_shopping_list(user_id, inserted)
+    return inserted
+
+
+@transaction.atomic
+def remove_recipes_in_bulk(model, user_id, recipe_ids):
+    """Массовое удаление рецептов из избранного или корзины.
+
+    Строки блокируются и удаляются одним запросом без сигналов,
+    счётчики и список покупок обновляются здесь только для
+    действительно удалённых строк. Возвращает id удалённых рецептов.
+    """
+    marks = dict(
+        model.objects.select_for_update().filter(
+            user_id=user_id,
+            recipe_id__in=recipe_ids
+        ).values_list('pk', 'recipe_id')
+    )
+    if not marks:
+        return []
+    removed = list(marks.values())
+    if model is ShoppingCart:
+        remove_from_shopping_list(user_id, removed)
+    # _raw_delete удаляет строки одним DELETE без сбора объектов
+    # и поштучных сигналов pre_delete и post_delete.
+    model.objects.filter(pk__in=marks)._raw_delete(model.objects.db)
+    change_counter(Recipe, removed, RECIPE_COUNTERS[model], -1)
+    return removed
+
+
+def bump_recipe_versions(recipe_ids):
+    """Смена версии рецептов, сбрасывающая кэш их представлений.
+
+    Версия - метка времени, поэтому не повторяется даже после
+    сохранения экземпляра с устаревшей версией. Заодно меняется
+    поколение кэша списка рецептов.
+    """
+    Recipe.objects.filter(pk__in=recipe_ids).update(version=time.time_ns())
+    bump_recipe_list()
+
+
+def bump_recipe_list():
+    """Смена поколения кэша списка рецептов после фиксации транзакции."""
+    bump_catalogue_version('recipe-list')
+
+
+def _actual_count(counted_model, relation):
+    """Подзапрос фактического кол-ва связанных строк."""
+    return Coalesce(
+        models.Subquery(
+            counted_model.objects.filter(
+                **{relation: models.OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                total=models.Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def recount_counters(fix=True):
+    """Проверка и исправление расхождений денормализованных счётчиков.
+
+    Возвращает словарь с кол-вом строк с расхождением по каждому
+    счётчику.
+    """
+    drift = {}
+    for model, field, counted_model, relation in COUNTERS:
+        actual = _actual_count(counted_model, relation)
+        wrong = model.objects.annotate(actual=actual).exclude(
+            **{field: models.F('actual')}
+        )
+        drift[f'{model.__name__}.{field}'] = wrong.count()
+        if fix and drift[f'{model.__name__}.{field}']:
+            model.objects.filter(
+                pk__in=wrong.values('pk')
+            ).update(**{field: actual})
+    return drift
@@ -0,0 +1,94 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+
+from .catalogue import bump_catalogue_version
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .services import (add_to_shopping_list, bump_recipe_list,
+                       bump_recipe_versions, change_counter,
+                       remove_from_shopping_list)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, **kwargs):
+    """Пополнение списка покупок при добавлении рецепта в корзину."""
+    if created:
+        add_to_shopping_list(instance.user_id, [instance.recipe_id])
+        change_counter(Recipe, [instance.recipe_id], 'cart_count', 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    """Вычитание из списка покупок при удалении рецепта из корзины.
+
+    Используется pre_delete: при каскадном удалении рецепта его
+    ингредиенты ещё доступны.
+    """
+    remove_from_shopping_list(instance.user_id, [instance.recipe_id])
+    change_counter(Recipe, [instance.recipe_id], 'cart_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    """Увеличение счётчика избранного рецепта."""
+    if created:
+        change_counter(Recipe, [instance.recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    """Уменьшение счётчика избранного рецепта."""
+    change_counter(Recipe, [instance.recipe_id], 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Увеличение счётчика рецептов автора или смена версии рецепта."""
+    if created:
+        change_counter(User, [instance.author_id], 'recipes_count', 1)
+        bump_recipe_list()
+    else:
+        bump_recipe_versions([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Уменьшение счётчика рецептов автора."""
+    change_counter(User, [instance.author_id], 'recipes_count', -1)
+    bump_recipe_list()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Смена версии справочника ингредиентов."""
+    bump_catalogue_version('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Смена версии справочника тегов."""
+    bump_catalogue_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def catalogue_item_changed(sender, instance, **kwargs):
+    """Смена версии рецептов с изменённым тегом или ингредиентом."""
+    if not kwargs.get('created'):
+        bump_recipe_versions(instance.recipe.values('pk'))
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, update_fields, **kwargs):
+    """Смена версии рецептов автора при изменении его данных.
+
+    Обновление только времени входа на представления не влияет.
+    """
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump_recipe_versions(instance.recipe.values('pk'))
@@ -14,7 +14,13 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'is_staff',
-        'date_joined'
+        'date_joined',
+        'recipes_count',
+        'subscribers_count'
+    )
+    readonly_fields = (
+        'recipes_count',
+        'subscribers_count'
     )
     search_fields = (
         'username',
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    Subscribe = apps.get_model('users', 'Subscribe')
+    User = apps.get_model('users', 'User')
+    duplicates = Subscribe.objects.values('user', 'author').annotate(
+        first_id=models.Min('id'),
+        total=models.Count('id')
+    ).filter(total__gt=1)
+    author_ids = set()
+    for duplicate in duplicates:
+        Subscribe.objects.filter(
+            user=duplicate['user'],
+            author=duplicate['author']
+        ).exclude(id=duplicate['first_id']).delete()
+        author_ids.add(duplicate['author'])
+    for author_id in author_ids:
+        User.objects.filter(id=author_id).update(
+            subscribers_count=Subscribe.objects.filter(
+                author=author_id
+            ).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_subscriptions,
+            migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscribe'),
+        ),
+    ]
@@ -2,7 +2,32 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class DenormalizedFieldsMixin:
+    """Сохранение экземпляра без денормализованных полей.
+
+    Поля из denormalized_fields меняются только запросами update()
+    через F(), поэтому обычное сохранение их не перезаписывает, иначе
+    значение из памяти затрёт параллельные изменения.
+    """
+    denormalized_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.denormalized_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(DenormalizedFieldsMixin, AbstractUser):
     """Класс модели пользователя."""
     username = models.CharField(
         verbose_name='Логин',
@@ -32,6 +57,16 @@ class User(AbstractUser):
         max_length=150,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Всего рецептов',
+        default=0
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Всего подписчиков',
+        default=0
+    )
+
+    denormalized_fields = ('recipes_count', 'subscribers_count')
 
     USERNAME_FIELD = 'email'
 
@@ -68,6 +103,12 @@ class Subscribe(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_subscribe'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
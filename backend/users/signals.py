@@ -0,0 +1,23 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscribe, User
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_saved(sender, instance, created, **kwargs):
+    """Увеличение счётчика подписчиков автора."""
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            subscribers_count=F('subscribers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, **kwargs):
+    """Уменьшение счётчика подписчиков автора."""
+    User.objects.filter(pk=instance.author_id).update(
+        subscribers_count=Greatest(F('subscribers_count') - 1, 0)
+    )